@@ -0,0 +1,324 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from yarl import URL
+
+from http_cache import ResponseCache, cache_mode, get_cache
+from http_client import DEFAULT_STATUS_FORCELIST, DEFAULT_TIMEOUT, RATE_CONTROL, STANDIN_URL, THROTTLE_STATUSES, Timeout, standin_url
+from http_metrics import METRICS, endpoint_label, register_exit_report, registry
+from rate_control import DEFAULT_PAUSE, MAX_THROTTLE_RETRIES, HostLimiter, get_limiter, parse_retry_after
+
+# asyncio fetch engine: one event loop, one aiohttp session per source, with async pagination (Link header and
+# offset) and fan-out for keyed lookups. Retries, timeouts, per-host rate control, the disk cache, the stand-in
+# server and metrics behave as in http_client; errors are raised as requests exceptions so existing handlers still apply.
+# Usage: async with AsyncFetcher(DATA_SOURCE, headers=HEADERS) as fetcher: data = await fetcher.get_json(url, params)
+# Sync code consumes an async crawl through iterate(): for page in iterate(crawl()): ...
+
+# Set Globals
+HOST_CONCURRENCY: int = int(os.environ.get('ASYNC_HOST_CONCURRENCY', 16))     # Requests in flight per host
+MAX_CONCURRENCY: int = int(os.environ.get('ASYNC_MAX_CONCURRENCY', 256))      # Requests in flight per fetcher
+MAX_RETRIES: int = 5                                                           # Retries per request
+BACKOFF_FACTOR: float = 1                                                      # Exponential backoff (1s, 2s, 4s, etc.)
+BACKOFF_MAX: float = 60                                                        # Maximum backoff time between retries
+LIMITER_POLL: float = 0.01                                                     # Seconds between checks while a host is at its concurrency limit
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+T = TypeVar("T")
+
+
+class FetchResponse:
+    """
+    A fully read response: status, final URL, headers and body.
+    """
+
+    def __init__(self, url: str, status: int, reason: Optional[str], headers: Dict[str, str], body: bytes, from_cache: bool = False):
+        self.url = url
+        self.status_code = status
+        self.reason = reason
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = body
+        self.from_cache = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    @property
+    def links(self) -> Dict[str, Dict[str, str]]:
+        # Same shape as requests.Response.links
+        header = self.headers.get("Link")
+        if not header:
+            return {}
+        return {link.get("rel") or link.get("url"): link for link in requests.utils.parse_header_links(header)}
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} {self.reason} for url: {self.url}")
+
+class AsyncFetcher:
+    """
+    Async HTTP client for one source. With rate_control, requests are admitted
+    by the same per-host limiters as the sync sessions (see rate_control.py),
+    which also pace throttled retries; without it every host gets a semaphore
+    of host_concurrency slots and 429 (or 403/503 with Retry-After) waits for
+    the time the server asks for. Other retryable statuses and connection
+    errors are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Timeout = DEFAULT_TIMEOUT,
+        host_concurrency: int = HOST_CONCURRENCY,
+        max_concurrency: int = MAX_CONCURRENCY,
+        retries: int = MAX_RETRIES,
+        backoff_factor: float = BACKOFF_FACTOR,
+        status_forcelist: Iterable[int] = DEFAULT_STATUS_FORCELIST,
+        cache_ttl: float = 0,
+        rate_control: bool = RATE_CONTROL,
+    ):
+        self.source = source
+        self.headers = requests.structures.CaseInsensitiveDict({key: value for key, value in (headers or {}).items() if value is not None})
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        self.host_concurrency = host_concurrency
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.rate_control = rate_control
+        # As in create_session: throttling statuses are left to the rate controller
+        self.status_forcelist = set(status_forcelist) - (set(THROTTLE_STATUSES) if rate_control else set())
+        self.cache: Optional[ResponseCache] = get_cache() if cache_ttl > 0 else None
+        self.cache_ttl = cache_ttl
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+        if METRICS:
+            register_exit_report()
+
+    async def __aenter__(self) -> "AsyncFetcher":
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.host_concurrency)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=dict(self.headers))
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.session.close()
+
+    def semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.host_concurrency)
+        return self.semaphores[host]
+
+    def backoff(self, attempt: int) -> float:
+        return min(BACKOFF_MAX, self.backoff_factor * 2 ** (attempt - 1)) if attempt > 1 else 0
+
+    async def acquire(self, host: str) -> None:
+        if not self.rate_control:
+            await self.semaphore(host).acquire()
+            return
+        # Poll the shared limiter instead of blocking the event loop on its condition
+        limiter = get_limiter(host)
+        while True:
+            acquired, wait = limiter.try_acquire()
+            if acquired:
+                return
+            await asyncio.sleep(LIMITER_POLL if wait is None else wait)
+
+    def release(self, host: str, response: Optional[FetchResponse]) -> bool:
+        # Returns True when the response was a throttle
+        if self.rate_control:
+            return get_limiter(host).release(response)
+        self.semaphore(host).release()
+        return response is not None and HostLimiter.is_throttle(response)
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None, raise_for_status: bool = True) -> FetchResponse:
+        # Encode the URL exactly as requests would, so cache entries are shared with the sync sessions
+        url = requests.Request("GET", url, params={key: value for key, value in (params or {}).items() if value is not None}).prepare().url
+        accept = self.headers.get("Accept", "")
+        key = ResponseCache.url_key("GET", url, accept)
+        mode = cache_mode()
+        # SQLite calls block, so they run on the default executor
+        loop = asyncio.get_running_loop()
+        if self.cache is not None and mode == "on":
+            hit = await loop.run_in_executor(None, self.cache.get, key, self.cache_ttl)
+            if hit is not None:
+                response = FetchResponse(hit["url"], hit["status"], hit["reason"], hit["headers"], hit["body"], from_cache=True)
+                self.observe(url, response, 0.0, 0, 0.0, 0.0)
+                return response
+
+        response = await self.send(url)
+        if self.cache is not None and mode != "off" and response.status_code == 200:
+            await loop.run_in_executor(
+                None, self.cache.put, key, self.source, response.url, response.status_code, response.reason, dict(response.headers), response.content
+            )
+        if raise_for_status:
+            response.raise_for_status()
+        return response
+
+    async def send(self, url: str) -> FetchResponse:
+        target = standin_url(url, STANDIN_URL) if STANDIN_URL else url
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        retries, backoff, queue = 0, 0.0, 0.0
+        attempt, throttles, throttled = 0, 0, False
+        response: Optional[FetchResponse] = None
+        try:
+            while True:
+                waited = time.perf_counter()
+                await self.acquire(host)
+                # Waiting out a throttle pause is backoff; any other wait for a slot is queueing
+                if throttled and self.rate_control:
+                    backoff += time.perf_counter() - waited
+                else:
+                    queue += time.perf_counter() - waited
+                response, error = None, None
+                try:
+                    async with self.session.get(URL(target, encoded=True)) as raw:
+                        response = FetchResponse(url, raw.status, raw.reason, dict(raw.headers), await raw.read())
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+                finally:
+                    throttled = self.release(host, response)
+
+                if throttled and throttles < MAX_THROTTLE_RETRIES:
+                    throttles += 1
+                    retries += 1
+                    if self.rate_control:
+                        # The limiter has already paused the host for as long as the server asked
+                        print(f"Throttled by {host} ({response.status_code}); retrying at {get_limiter(host).rate:.2f} req/s")
+                        continue
+                    pause = parse_retry_after(response.headers.get("Retry-After"))
+                    delay = DEFAULT_PAUSE if pause is None else pause
+                else:
+                    if error is None and (response.status_code not in self.status_forcelist or attempt == self.retries):
+                        return response
+                    if error is not None and attempt == self.retries:
+                        raise requests.exceptions.ConnectionError(f"{url}: {error!r}") from error
+                    delay = self.backoff(attempt + 1)
+                    attempt += 1
+                    retries += 1
+                backoff += delay
+                await asyncio.sleep(delay)
+        finally:
+            self.observe(url, response, time.perf_counter() - start, retries, backoff, queue)
+
+    def observe(self, url: str, response: Optional[FetchResponse], latency: float, retries: int, backoff: float, queue: float) -> None:
+        if not METRICS:
+            return
+        registry.observe(
+            self.source,
+            endpoint_label(url),
+            status=str(response.status_code) if response is not None else "error",
+            latency=latency,
+            size=len(response.content) if response is not None else 0,
+            retries=retries,
+            backoff=backoff,
+            queue=queue,
+            cached=bool(response is not None and response.from_cache),
+        )
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        return (await self.get(url, params)).json()
+
+async def paginate_links(fetcher: AsyncFetcher, url: str, params: Optional[Dict[str, Any]] = None, key: str = "features") -> AsyncIterator[List[Any]]:
+    """
+    Yields the `key` list of every page of a Link-header paginated endpoint
+    (NWS). The next page is requested while the caller consumes the current one;
+    params are only sent with the first request.
+    """
+    pending: Optional[asyncio.Task] = asyncio.ensure_future(fetcher.get(url, params))
+    try:
+        while pending is not None:
+            response = await pending
+            next_url: Optional[str] = response.links.get("next", {}).get("url")
+            pending = asyncio.ensure_future(fetcher.get(next_url)) if next_url else None
+            yield response.json().get(key, [])
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+
+async def paginate_offsets(
+    fetcher: AsyncFetcher,
+    url: str,
+    limit: int,
+    params: Optional[Dict[str, Any]] = None,
+    window: int = HOST_CONCURRENCY,
+    total: Callable[[Any], int] = lambda page: page.get("METADATA", {}).get("RESULTS", {}).get("TOTAL_COUNT", 0),
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yields (offset, page) for every decoded page of an offset-paginated
+    endpoint (RIDB). The first page supplies the total; up to `window` later
+    pages are in flight at once and are yielded in offset order.
+    """
+    def fetch(offset: int) -> asyncio.Task:
+        return asyncio.ensure_future(fetcher.get_json(url, {**(params or {}), "limit": limit, "offset": offset}))
+
+    first = await fetch(0)
+    yield 0, first
+    offsets = iter(range(limit, total(first), limit))
+    pending: Deque[Tuple[int, asyncio.Task]] = deque((offset, fetch(offset)) for offset, _ in zip(offsets, range(window)))
+    try:
+        while pending:
+            offset, task = pending.popleft()
+            page = await task
+            next_offset = next(offsets, None)
+            if next_offset is not None:
+                pending.append((next_offset, fetch(next_offset)))
+            yield offset, page
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
+
+def iterate(iterable: AsyncGenerator[T, None]) -> Iterator[T]:
+    """
+    Yields the items of an async generator (such as a crawl over the paginators
+    above) to synchronous code. The event loop runs in a background thread, so
+    requests already in flight keep going while the caller handles each item.
+    Closing the generator early closes the async generator too.
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="async-fetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                item = asyncio.run_coroutine_threadsafe(iterable.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        asyncio.run_coroutine_threadsafe(iterable.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+async def fan_out(keys: Iterable[K], fetch: Callable[[K], Awaitable[V]], limit: Optional[int] = None) -> Dict[K, V]:
+    """
+    Runs fetch(key) for every distinct key concurrently (at most `limit` at a
+    time, on top of the per-host limits) and returns {key: result}.
+    """
+    keys = list(dict.fromkeys(keys))
+    gate = asyncio.Semaphore(limit) if limit else None
+
+    async def run(key: K) -> V:
+        if gate is None:
+            return await fetch(key)
+        async with gate:
+            return await fetch(key)
+
+    results = await asyncio.gather(*(run(key) for key in keys))
+    return dict(zip(keys, results))
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+import argparse
+import copy
+import csv
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from main import discover_sources, run_source
+from source_plugins import script_for
+
+# Offline benchmark: serves recorded API responses from a local stand-in server and runs every parse_*.py end to end.
+# Sources are pointed at the stand-in through HTTP_STANDIN_URL (see http_client.py); nothing leaves the machine.
+# Usage: python benchmark.py [sources...] [--pages N] [--latency MS] [--error-rate P] [--compare old.json]
+
+# Set Globals
+FIXTURES_DIR: Path = Path(__file__).resolve().parent / 'benchmarks' / 'fixtures'   # Recorded responses, one record per API
+RESULTS_DIR: Path = Path('benchmarks') / 'results'                     # Default location of the JSON reports
+DEFAULT_PAGES: int = 20                                                 # Pages served by each paginated endpoint
+NWS_PAGE_SIZE: int = 100                                                # Alerts per NWS page
+RIDB_PAGE_SIZE: int = 50                                                # Campsites per RIDB page (the API maximum)
+CAMPSITES_PER_FACILITY: int = 10                                        # RIDB facilities are shared by this many campsites
+RIDB_UPDATED: date = date(2024, 11, 19)                                 # Newest RIDB LastUpdatedDate; older records spread over two years
+DEFAULT_COUNTIES: int = 3200                                            # Rows in the generated NRI county table
+DEFAULT_TIMEOUT: float = 600                                            # Per-source timeout in seconds
+NRI_RATINGS: List[str] = ["Very High", "Relatively High", "Relatively Moderate", "Relatively Low", "Very Low", "No Rating"]
+INPUT_PREFIXES: Tuple[str, ...] = ("NRI_Table_Counties",)               # Files a source downloads rather than produces
+
+
+def load_fixture(name: str) -> Any:
+    with open(FIXTURES_DIR / name) as f:
+        return json.load(f)
+
+def build_nri_zip(counties: int, places: List[Dict[str, Any]], seed: int = 0) -> bytes:
+    # NRI county table with the published columns and random scores, zipped like FEMA's download
+    from parse_fema_nri import CSV_FILE, disasters, get_selected_columns
+
+    rng = random.Random(seed)
+    states = sorted({(place["state_name"].title(), place["state_alpha"]) for place in places})
+    columns = ["STCOFIPS", "COUNTYTYPE"] + get_selected_columns(disasters)
+    table = io.StringIO()
+    writer = csv.DictWriter(table, fieldnames=columns)
+    writer.writeheader()
+    numbers: Dict[str, int] = {}
+    for i in range(counties):
+        # The first rows are the counties the other sources ask about; the rest are synthetic
+        if i < len(places):
+            state, abbr, county = places[i]["state_name"].title(), places[i]["state_alpha"], places[i]["county_name"].title()
+        else:
+            (state, abbr), county = states[i % len(states)], f"Synthetic {i}"
+        numbers[abbr] = numbers.get(abbr, 0) + 1
+        row: Dict[str, Any] = {
+            "STCOFIPS": (states.index((state, abbr)) + 1) * 1000 + numbers[abbr],
+            "COUNTYTYPE": "County",
+            "STATE": state,
+            "STATEABBRV": abbr,
+            "COUNTY": county,
+            "POPULATION": rng.randrange(1000, 1000000),
+            "BUILDVALUE": rng.randrange(10**8, 10**11),
+            "AGRIVALUE": rng.randrange(10**6, 10**9),
+            "RISK_VALUE": round(rng.uniform(0, 10**8), 2),
+            "AREA": round(rng.uniform(100, 10000), 3),
+            "RISK_SCORE": round(rng.uniform(0, 100), 4),
+            "RISK_RATNG": rng.choice(NRI_RATINGS),
+            "EAL_VALT": round(rng.uniform(0, 10**8), 2),
+        }
+        for hazard in disasters:
+            row[f"{hazard}_RISKV"] = round(rng.uniform(0, 10**7), 2)
+            row[f"{hazard}_RISKS"] = round(rng.uniform(0, 100), 4)
+            row[f"{hazard}_RISKR"] = rng.choice(NRI_RATINGS)
+        writer.writerow(row)
+
+    hazard_info = io.StringIO()
+    info = csv.writer(hazard_info)
+    info.writerow(["OID_", "Hazard", "Prefix", "Service", "Start", "End_", "TotalYears", "FrequencyModel"])
+    for oid, hazard in enumerate(disasters, 1):
+        info.writerow([oid, hazard, hazard, "NRI", 1996, 2019, 24, "Events"])
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(CSV_FILE, table.getvalue())
+        z.writestr("NRI_HazardInfo.csv", hazard_info.getvalue())
+    return archive.getvalue()
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the NWS, RIDB, QuickStats and NRI endpoints.
+    Requests arrive as /<host>/<path>; responses are built from the fixtures,
+    scaled to `pages` pages, delayed by `latency` seconds and replaced by
+    `error_status` with probability `error_rate`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, pages: int = DEFAULT_PAGES, counties: int = DEFAULT_COUNTIES, latency: float = 0,
+                 error_rate: float = 0, error_status: int = 503, seed: int = 0):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.pages = pages
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats: Dict[str, int] = {"requests": 0, "bytes": 0, "errors": 0}
+        self.alert = load_fixture("nws_alert.json")
+        self.campsites = load_fixture("ridb_campsites.json")
+        self.facility = load_fixture("ridb_facility.json")
+        self.quickstats = load_fixture("nass_quickstats.json")["data"]
+        self.nri_zip = build_nri_zip(counties, self.quickstats, seed)
+        self.bodies: Dict[Tuple[str, ...], bytes] = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats)
+
+    def count(self, sent: int, error: bool) -> None:
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += sent
+            self.stats["errors"] += int(error)
+
+    def inject_error(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.error_rate
+
+    def cached(self, key: Tuple[str, ...], build) -> bytes:
+        # Each distinct page is serialized once; only the first request pays for it
+        with self.lock:
+            body = self.bodies.get(key)
+        if body is None:
+            body = json.dumps(build()).encode()
+            with self.lock:
+                self.bodies[key] = body
+        return body
+
+    # NWS: fixed-size pages chained through Link rel="next"
+    def nws_alerts(self, query: Dict[str, str]) -> Tuple[bytes, Dict[str, str]]:
+        cursor = int(query.get("cursor", 0))
+        places = [f'{row["county_name"].title()}, {row["state_alpha"]}' for row in self.quickstats]
+
+        def build() -> Dict[str, Any]:
+            features = []
+            for i in range(cursor * NWS_PAGE_SIZE, (cursor + 1) * NWS_PAGE_SIZE):
+                alert = copy.deepcopy(self.alert)
+                alert["id"] = alert["properties"]["@id"] = f'{alert["id"].rsplit(".", 1)[0]}.{i}'
+                alert["properties"]["id"] = f'{alert["properties"]["id"].rsplit(".", 1)[0]}.{i}'
+                alert["properties"]["areaDesc"] = "; ".join(places[(i + step) % len(places)] for step in (0, 7, 13))
+                features.append(alert)
+            return {"type": "FeatureCollection", "features": features}
+
+        # Recorded alerts never change, so a conditional re-poll is always answered 304
+        headers = {"Content-Type": "application/geo+json", "ETag": f'"nws-{cursor}-{self.pages}"', "Cache-Control": "public, max-age=0"}
+        if cursor + 1 < self.pages:
+            headers["Link"] = f'<https://api.weather.gov/alerts?cursor={cursor + 1}>; rel="next"'
+        return self.cached(("nws", str(cursor)), build), headers
+
+    # RIDB: offset pagination with METADATA.RESULTS.TOTAL_COUNT, and the lastupdated (mm-dd-yyyy) filter
+    def ridb(self, path: str, query: Dict[str, str]) -> Tuple[bytes, Dict[str, str]]:
+        total_campsites = self.pages * RIDB_PAGE_SIZE
+        total_facilities = max(1, total_campsites // CAMPSITES_PER_FACILITY)
+        limit, offset = int(query.get("limit", RIDB_PAGE_SIZE)), int(query.get("offset", 0))
+        since = query.get("lastupdated", "")
+
+        def updated(i: int) -> str:
+            return (RIDB_UPDATED - timedelta(days=i * 37 % 730)).isoformat()
+
+        def facility(i: int) -> Dict[str, Any]:
+            record = copy.deepcopy(self.facility)
+            record["FacilityID"] = str(i + 1)
+            record["FacilityName"] = f'{record["FacilityName"]} {i + 1}'
+            record["LastUpdatedDate"] = updated(i)
+            return record
+
+        def campsite(i: int) -> Dict[str, Any]:
+            record = copy.deepcopy(self.campsites[i % len(self.campsites)])
+            record["CampsiteID"] = str(i + 1)
+            record["FacilityID"] = str(i // CAMPSITES_PER_FACILITY + 1)
+            record["LastUpdatedDate"] = updated(i)
+            return record
+
+        def page(total: int, make) -> Dict[str, Any]:
+            rows = range(total)
+            if since:
+                cutoff = datetime.strptime(since, "%m-%d-%Y").date().isoformat()
+                rows = [i for i in rows if updated(i) >= cutoff]
+            records = [make(i) for i in rows[offset:offset + limit]]
+            return {"RECDATA": records, "METADATA": {"RESULTS": {"CURRENT_COUNT": len(records), "TOTAL_COUNT": len(rows)}}}
+
+        if path == "/api/v1/campsites":
+            return self.cached(("campsites", str(offset), str(limit), since), lambda: page(total_campsites, campsite)), {}
+        if path == "/api/v1/facilities":
+            return self.cached(("facilities", str(offset), str(limit), since), lambda: page(total_facilities, facility)), {}
+        facility_id = path.rsplit("/", 1)[-1]
+        return self.cached(("facility", facility_id), lambda: facility(int(facility_id) - 1)), {}
+
+    # QuickStats: every recorded county row, filtered by state_name and county_name like the real API
+    def quickstats_rows(self, query: Dict[str, str]) -> Tuple[Optional[bytes], Dict[str, str]]:
+        state, county = query.get("state_name"), query.get("county_name")
+        rows = [
+            row for row in self.quickstats
+            if (state is None or row["state_name"] == state) and (county is None or row["county_name"] == county)
+        ]
+        if not rows:
+            return None, {}
+        return self.cached(("quickstats", state or "", county or ""), lambda: {"data": rows}), {}
+
+    def route(self, host: str, path: str, query: Dict[str, str]) -> Tuple[int, bytes, Dict[str, str]]:
+        if host == "api.weather.gov" and path == "/alerts":
+            return (200, *self.nws_alerts(query))
+        if host == "ridb.recreation.gov" and path.startswith("/api/v1/"):
+            return (200, *self.ridb(path, query))
+        if host == "quickstats.nass.usda.gov":
+            body, headers = self.quickstats_rows(query)
+            if body is None:
+                return 400, b'{"error": ["no data"]}', {}
+            return 200, body, headers
+        if host == "hazards.fema.gov" and path.endswith(".zip"):
+            return 200, self.nri_zip, {"Content-Type": "application/zip", "ETag": f'"{len(self.nri_zip)}"'}
+        return 404, b'{"error": "not recorded"}', {}
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"       # Keep-alive, like the real APIs
+    server: StandInServer
+
+    def do_GET(self) -> None:
+        self.respond(body=True)
+
+    def do_HEAD(self) -> None:
+        self.respond(body=False)
+
+    def respond(self, body: bool) -> None:
+        url = urlsplit(self.path)
+        host, _, path = url.path.lstrip("/").partition("/")
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        error = self.server.inject_error()
+        if error:
+            status, content, headers = self.server.error_status, b'{"error": "injected"}', {"Retry-After": "0"}
+        else:
+            status, content, headers = self.server.route(host, f"/{path}", query)
+            if status == 200 and "ETag" in headers and self.headers.get("If-None-Match") == headers["ETag"]:
+                status, content = 304, b""
+        self.send_response(status)
+        headers.setdefault("Content-Type", "application/json")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if body:
+            self.wfile.write(content)
+        self.server.count(len(content) if body else 0, error)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+def count_records(run_dir: Path) -> int:
+    # Rows written by the source, in whichever format OUTPUT_FORMAT selected
+    records = 0
+    for path in run_dir.iterdir():
+        if not path.is_file() or path.name.startswith(INPUT_PREFIXES):
+            continue
+        suffix = path.suffix.lower()                            # FEMA NRI writes .CSV
+        if suffix == ".csv":
+            with open(path, newline="") as f:
+                records += max(0, sum(1 for _ in csv.reader(f)) - 1)
+        elif suffix == ".jsonl":
+            with open(path) as f:
+                records += sum(1 for _ in f)
+        elif suffix == ".parquet":
+            import pyarrow.parquet as pq
+            records += pq.ParquetFile(path).metadata.num_rows
+    return records
+
+def network_totals(run_dir: Path) -> Dict[str, float]:
+    # Retry and backoff totals from the source's own http_metrics report
+    totals = {"Retries": 0, "Backoff": 0.0, "Queue": 0.0}
+    for path in (run_dir / "metrics").glob("*.json"):
+        for endpoint in json.loads(path.read_text())["endpoints"].values():
+            totals["Retries"] += endpoint["retries"]
+            totals["Backoff"] += endpoint["backoff_seconds"]
+            totals["Queue"] += endpoint["queue_seconds"]
+    return totals
+
+def source_env(server: StandInServer, run_dir: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "HTTP_STANDIN_URL": server.url,
+        "HTTP_CACHE": "off",                                  # Measure the pipeline, not the response cache
+        "HTTP_CACHE_PATH": str(run_dir / "http_cache.sqlite"),
+        "HTTP_METRICS_DIR": str(run_dir / "metrics"),
+    })
+    # Placeholder keys keep the sources on their normal path; the stand-in ignores them
+    env.setdefault("REC_RIDB_API_KEY", "benchmark")
+    env.setdefault("NASS_API_KEY", "benchmark")
+    return env
+
+def run_benchmark(script: Path, server: StandInServer, work_dir: Path, timeout: Optional[float]) -> Dict[str, Any]:
+    run_dir = Path(tempfile.mkdtemp(prefix=f"{script.stem}_", dir=work_dir))
+    before = server.snapshot()
+    result = run_source(script, timeout, cwd=run_dir, env=source_env(server, run_dir), log_dir=run_dir)
+    after = server.snapshot()
+    result.update({
+        "Requests": after["requests"] - before["requests"],
+        "Bytes": after["bytes"] - before["bytes"],
+        "Errors": after["errors"] - before["errors"],
+        "Records": count_records(run_dir),
+        **network_totals(run_dir),
+    })
+    result["Throughput"] = result["Records"] / result["Wall"] if result["Wall"] else None
+    return result
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # The median-wall run stands for the source; every wall time is kept for spread
+    walls = [run["Wall"] for run in runs]
+    summary = dict(sorted(runs, key=lambda run: run["Wall"])[(len(runs) - 1) // 2])
+    summary["WallRuns"] = walls
+    summary["WallStdev"] = statistics.stdev(walls) if len(walls) > 1 else 0.0
+    return summary
+
+def revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def fmt(value: Optional[float], scale: float = 1, digits: int = 2) -> str:
+    return f"{value / scale:.{digits}f}" if value is not None else "-"
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    print(f"\n{'Source':<20} {'Status':<8} {'Wall(s)':>8} {'CPU(s)':>7} {'RSS(MiB)':>9} {'Requests':>9} {'MiB':>7} {'Errors':>7} {'Retries':>8} {'Backoff':>8} {'Records':>8} {'Rec/s':>9}")
+    for r in results:
+        print(f'{r["Source"]:<20} {r["Status"]:<8} {r["Wall"]:>8.2f} {fmt(r["CPU"]):>7} {fmt(r["MaxRSS"], 2**20, 1):>9} '
+              f'{r["Requests"]:>9} {fmt(r["Bytes"], 2**20, 1):>7} {r["Errors"]:>7} {r["Retries"]:>8} {r["Backoff"]:>8.2f} {r["Records"]:>8} {fmt(r["Throughput"], 1, 1):>9}')
+
+def print_comparison(results: List[Dict[str, Any]], baseline_file: str) -> None:
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    old = {r["Source"]: r for r in baseline["results"]}
+    print(f"\nCompared with {baseline.get('revision') or baseline_file} (negative is better for Wall/RSS/Requests):")
+    print(f"{'Source':<20} {'Wall':>9} {'RSS':>9} {'Requests':>9} {'Rec/s':>9}")
+    for r in results:
+        if r["Source"] not in old:
+            continue
+
+        def delta(key: str) -> str:
+            before, after = old[r["Source"]].get(key), r.get(key)
+            return f"{(after - before) / before:+9.1%}" if before and after is not None else f"{'-':>9}"
+
+        print(f'{r["Source"]:<20} {delta("Wall")} {delta("MaxRSS")} {delta("Requests")} {delta("Throughput")}')
+
+def main(sources: List[Path], args: argparse.Namespace) -> int:
+    server = StandInServer(args.pages, args.counties, args.latency / 1000, args.error_rate, args.error_status, args.seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    work_dir = Path(tempfile.mkdtemp(prefix="storm_chaser_bench_"))
+    print(f"Stand-in server on {server.url}; working in {work_dir}")
+
+    results: List[Dict[str, Any]] = []
+    try:
+        for script in sources:
+            runs = []
+            for attempt in range(args.repeat):
+                print(f"Benchmarking {script.stem} ({attempt + 1}/{args.repeat})...")
+                runs.append(run_benchmark(script, server, work_dir, args.timeout or None))
+                if runs[-1]["Status"] != "ok":
+                    print(f'{script.stem} {runs[-1]["Status"]}; see {runs[-1]["Log"]}')
+                    break
+            results.append(summarize(runs))
+    finally:
+        server.shutdown()
+        if not args.keep and all(r["Status"] == "ok" for r in results):
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+    report = {
+        "revision": revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key not in ("sources", "output", "compare", "keep")},
+        "results": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"BENCH_{datetime.now():%Y%m%dT%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"--- Saved to {output} ---")
+    if args.compare:
+        print_comparison(results, args.compare)
+    return 0 if all(r["Status"] == "ok" for r in results) else 1
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run parse_*.py sources against a local stand-in of their APIs and report timings.")
+    parser.add_argument("sources", nargs="*", help="Only benchmark these sources (e.g. parse_nws_alerts)")
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES, help=f"Pages served by paginated endpoints (default: {DEFAULT_PAGES})")
+    parser.add_argument("--counties", type=int, default=DEFAULT_COUNTIES, help=f"Rows in the NRI county table (default: {DEFAULT_COUNTIES})")
+    parser.add_argument("--latency", type=float, default=0, help="Milliseconds added to every response (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of responses replaced by an error (default: 0)")
+    parser.add_argument("--error-status", type=int, default=503, help="Status of injected errors, sent with Retry-After: 0 (default: 503)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for generated data and error injection (default: 0)")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="Runs per source; the median is reported (default: 1)")
+    parser.add_argument("-t", "--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"Per-source timeout in seconds, 0 for none (default: {DEFAULT_TIMEOUT:.0f})")
+    parser.add_argument("-o", "--output", help=f"JSON report path (default: {RESULTS_DIR}/BENCH_<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep each run's working directory (outputs and logs)")
+    args = parser.parse_args()
+
+    # Each source runs in its own interpreter so its environment, working directory and peak RSS are its own
+    sources = [script_for(name).resolve() for name in discover_sources(args.sources)]
+    if not sources:
+        print("No source scripts found to benchmark.")
+        sys.exit(1)
+    sys.exit(main(sources, args))
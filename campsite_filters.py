@@ -0,0 +1,130 @@
+import json
+import os
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Set, Tuple
+
+# Declarative campsite filter profiles for RIDB, compiled once and evaluated against indexed campsites.
+# Profiles live in ridb_filters.json: {profile: {"campsite_type": test, "equipment": test, "attributes": {name: test}}}
+# A test is a dict of operators: equals, not_equals, in, not_in, contains_any (all must hold).
+
+# Set Globals
+FILTERS_FILE: str = os.environ.get('RIDB_FILTERS_FILE', os.path.join(os.path.dirname(__file__), 'ridb_filters.json'))   # Filter profile definitions
+FILTER_PROFILE: str = os.environ.get('RIDB_FILTER_PROFILE', 'rv_full_hookup')    # Profile applied by parse_rec_ridb.py
+
+class CampsiteView(NamedTuple):
+    campsite_type: str              # CampsiteType, upper-cased
+    equipment: FrozenSet[str]       # EquipmentName values, as published
+    attributes: Dict[str, FrozenSet[str]]   # AttributeName -> every AttributeValue listed under it, upper-cased
+
+ValueTest = Callable[[str], bool]
+Predicate = Callable[[CampsiteView], bool]
+
+
+def index_campsite(campsite: Dict[str, Any]) -> CampsiteView:
+    # Normalize each campsite once so every profile reuses the same lookups; an attribute may be listed more than once
+    attributes: Dict[str, Set[str]] = {}
+    for attr in campsite.get("ATTRIBUTES") or []:
+        name = (attr.get("AttributeName") or "").upper()
+        attributes.setdefault(name, set()).add((attr.get("AttributeValue") or "").upper())
+    return CampsiteView(
+        campsite_type=(campsite.get("CampsiteType") or "").upper(),
+        equipment=frozenset(eq.get("EquipmentName") or "" for eq in campsite.get("PERMITTEDEQUIPMENT") or []),
+        attributes={name: frozenset(values) for name, values in attributes.items()},
+    )
+
+def index_page(campsites: List[Dict[str, Any]]) -> List[CampsiteView]:
+    return [index_campsite(campsite) for campsite in campsites]
+
+def compile_value_test(spec: Dict[str, Any], upper: bool = True) -> ValueTest:
+    def norm(value: str) -> str:
+        return value.upper() if upper else value
+
+    tests: List[ValueTest] = []
+    for op, arg in spec.items():
+        if op == "equals":
+            tests.append(lambda value, expected=norm(arg): value == expected)
+        elif op == "not_equals":
+            tests.append(lambda value, expected=norm(arg): value != expected)
+        elif op == "in":
+            tests.append(lambda value, allowed=frozenset(map(norm, arg)): value in allowed)
+        elif op == "not_in":
+            tests.append(lambda value, denied=frozenset(map(norm, arg)): value not in denied)
+        elif op == "contains_any":
+            tests.append(lambda value, tokens=tuple(map(norm, arg)): any(token in value for token in tokens))
+        else:
+            raise ValueError(f"Unknown filter operator: {op}")
+    return lambda value: all(test(value) for test in tests)
+
+def compile_profile(spec: Dict[str, Any]) -> Predicate:
+    checks: List[Predicate] = []
+    if "campsite_type" in spec:
+        type_test = compile_value_test(spec["campsite_type"])
+        checks.append(lambda view: type_test(view.campsite_type))
+    if "equipment" in spec:
+        # Equipment names are matched as published, like the original "RV" substring check
+        equipment_test = compile_value_test(spec["equipment"], upper=False)
+        checks.append(lambda view: any(equipment_test(name) for name in view.equipment))
+    for name, attr_spec in spec.get("attributes", {}).items():
+        # Matches when any value listed under the name passes; a missing attribute never matches, whatever the operator
+        attr_test = compile_value_test(attr_spec)
+        checks.append(lambda view, key=name.upper(), test=attr_test: any(test(value) for value in view.attributes.get(key, ())))
+    return lambda view: all(check(view) for check in checks)
+
+def compile_value_sql(column: str, spec: Dict[str, Any], upper: bool = True) -> Tuple[str, List[str]]:
+    # The SQL twin of compile_value_test: (condition on column, parameters)
+    def norm(value: str) -> str:
+        return value.upper() if upper else value
+
+    clauses: List[str] = []
+    params: List[str] = []
+    for op, arg in spec.items():
+        if op == "equals":
+            clauses.append(f"{column} = ?")
+            params.append(norm(arg))
+        elif op == "not_equals":
+            clauses.append(f"{column} != ?")
+            params.append(norm(arg))
+        elif op in ("in", "not_in"):
+            values = [norm(value) for value in arg]
+            clauses.append(f"{column} {'IN' if op == 'in' else 'NOT IN'} ({', '.join('?' * len(values))})" if values else ("0" if op == "in" else "1"))
+            params.extend(values)
+        elif op == "contains_any":
+            tokens = [norm(token) for token in arg]
+            clauses.append(f"({' OR '.join(f'instr({column}, ?) > 0' for _ in tokens)})" if tokens else "0")
+            params.extend(tokens)
+        else:
+            raise ValueError(f"Unknown filter operator: {op}")
+    return " AND ".join(clauses) or "1", params
+
+def compile_profile_sql(spec: Dict[str, Any]) -> Tuple[str, List[str]]:
+    """
+    Compiles a profile to a WHERE condition over ridb_store.py's tables
+    (campsites c, campsite_equipment, campsite_attributes) that selects the
+    same campsites as compile_profile's predicate.
+    """
+    clauses: List[str] = []
+    params: List[str] = []
+    if "campsite_type" in spec:
+        clause, args = compile_value_sql("c.campsite_type", spec["campsite_type"])
+        clauses.append(clause)
+        params.extend(args)
+    if "equipment" in spec:
+        clause, args = compile_value_sql("e.name", spec["equipment"], upper=False)
+        clauses.append(f"c.campsite_id IN (SELECT e.campsite_id FROM campsite_equipment e WHERE {clause})")
+        params.extend(args)
+    for name, attr_spec in spec.get("attributes", {}).items():
+        clause, args = compile_value_sql("a.value", attr_spec)
+        # Drives from the (name, value) index instead of probing every campsite; any of a name's values may match
+        clauses.append(f"c.campsite_id IN (SELECT a.campsite_id FROM campsite_attributes a WHERE a.name = ? AND {clause})")
+        params.extend([name.upper(), *args])
+    return " AND ".join(clauses) or "1", params
+
+def load_specs(path: str = FILTERS_FILE) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+def load_profiles(path: str = FILTERS_FILE) -> Dict[str, Predicate]:
+    return {name: compile_profile(spec) for name, spec in load_specs(path).items()}
+
+def match_profiles(views: List[CampsiteView], profiles: Dict[str, Predicate]) -> Dict[str, List[int]]:
+    # Evaluate several profiles over one indexed page: {profile: [positions of matching campsites]}
+    return {name: [i for i, view in enumerate(views) if predicate(view)] for name, predicate in profiles.items()}
@@ -0,0 +1,146 @@
+import csv
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+# County gazetteer keyed on 5-digit FIPS codes, with memoized name normalization.
+# Place names differ between sources ("Wayne County, TN", "Wayne, TN", "LaPaz" vs "La Paz");
+# every form is reduced to a (state_abbr, county_key) pair before lookup.
+
+# Set Globals
+GAZETTEER_COLUMNS = ["STCOFIPS", "STATEABBRV", "COUNTY", "COUNTYTYPE"]     # NRI columns the gazetteer is built from
+COUNTY_SUFFIXES = (" CITY AND BOROUGH", " CENSUS AREA", " MUNICIPALITY", " BOROUGH", " PARISH", " COUNTY")
+SAINT = re.compile(r"\bST\.?\s+")
+ZONE_FILE: str = os.environ.get('NWS_ZONE_FILE', 'nws_zone_counties.dbx')   # NWS zone-county correlation file (pipe-delimited "bp" format)
+UGC_CODE = re.compile(r"^([A-Z]{2})([CZ])(\d{3})$")
+
+# State FIPS codes by USPS abbreviation, for UGC county codes (TNC181 -> 47181)
+STATE_FIPS: Dict[str, str] = {
+    "AL": "01", "AK": "02", "AZ": "04", "AR": "05", "CA": "06", "CO": "08", "CT": "09", "DE": "10", "DC": "11",
+    "FL": "12", "GA": "13", "HI": "15", "ID": "16", "IL": "17", "IN": "18", "IA": "19", "KS": "20", "KY": "21",
+    "LA": "22", "ME": "23", "MD": "24", "MA": "25", "MI": "26", "MN": "27", "MS": "28", "MO": "29", "MT": "30",
+    "NE": "31", "NV": "32", "NH": "33", "NJ": "34", "NM": "35", "NY": "36", "NC": "37", "ND": "38", "OH": "39",
+    "OK": "40", "OR": "41", "PA": "42", "RI": "44", "SC": "45", "SD": "46", "TN": "47", "TX": "48", "UT": "49",
+    "VT": "50", "VA": "51", "WA": "53", "WV": "54", "WI": "55", "WY": "56", "AS": "60", "GU": "66", "MP": "69",
+    "PR": "72", "VI": "78",
+}
+
+
+@lru_cache(maxsize=None)
+def county_key(county_name: str) -> str:
+    # "St. Louis County" == "SAINT LOUIS", "LaPaz" == "LA PAZ", "Le Flore" == "LEFLORE"; independent cities keep "CITY"
+    key = county_name.upper().strip()
+    for suffix in COUNTY_SUFFIXES:
+        if key.endswith(suffix):
+            key = key[:-len(suffix)]
+            break
+    key = SAINT.sub("SAINT ", key)
+    return "".join(ch for ch in key if ch.isalnum())
+
+@lru_cache(maxsize=None)
+def split_place(place: str) -> Optional[Tuple[str, str]]:
+    # "Wayne County, TN" / "Wayne, TN" -> ("TN", "WAYNE")
+    name, _, abbr = place.rpartition(",")
+    abbr = abbr.strip().upper()
+    if not name or len(abbr) != 2:
+        return None
+    return abbr, county_key(name)
+
+class Gazetteer:
+    """
+    (state_abbr, county_key) -> FIPS index over every county in the NRI table.
+    """
+
+    def __init__(self, counties: pd.DataFrame):
+        self.fips: Dict[Tuple[str, str], str] = {}
+        self.names: Dict[str, str] = {}
+        for fips, abbr, county, county_type in counties[GAZETTEER_COLUMNS].itertuples(index=False):
+            fips = f"{int(fips):05d}"
+            # Independent cities share names with counties ("Richmond city" vs "Richmond County, VA")
+            name = f"{county} city" if str(county_type).lower() == "city" else str(county)
+            self.fips.setdefault((str(abbr), county_key(name)), fips)
+            self.names[fips] = f"{county} {county_type}, {abbr}"
+
+    def lookup(self, county: str, state_abbr: str) -> Optional[str]:
+        return self.fips.get((state_abbr.upper(), county_key(county)))
+
+    def lookup_place(self, place: str) -> Optional[str]:
+        key = split_place(place)
+        return self.fips.get(key) if key else None
+
+    def fips_series(self, places: pd.Series) -> pd.Series:
+        # Resolve a column of place names; each distinct name is parsed once
+        unique = places.dropna().unique()
+        resolved = {place: self.lookup_place(place) for place in unique}
+        return places.map(resolved)
+
+@lru_cache(maxsize=1)
+def load_gazetteer() -> Gazetteer:
+    # Built from the NRI county table (already cached as Parquet by parse_fema_nri)
+    from parse_fema_nri import CSV_FILE, ZIP_FILENAME, load_nri
+    return Gazetteer(load_nri(ZIP_FILENAME, CSV_FILE, GAZETTEER_COLUMNS))
+
+class AlertAreas:
+    """
+    NWS alert code -> county FIPS lookup. SAME codes ("047181") and UGC county
+    codes ("TNC181") name a county directly; UGC zone codes ("TNZ005") go
+    through the zone-county correlation table. Each distinct code is resolved once.
+    """
+
+    def __init__(self, zones: Optional[Dict[str, Tuple[str, ...]]] = None):
+        self.zones: Dict[str, Tuple[str, ...]] = zones or {}
+        self.codes: Dict[str, Tuple[str, ...]] = {}
+
+    def resolve(self, code: str) -> Tuple[str, ...]:
+        if code.isdigit() and len(code) == 6:
+            # SAME: leading digit is the part of the county, then state + county FIPS; xx000 is a whole state
+            return () if code.endswith("000") else (code[1:],)
+        match = UGC_CODE.match(code)
+        if match is None:
+            return ()
+        state, kind, number = match.groups()
+        if kind == "C":
+            return (STATE_FIPS[state] + number,) if state in STATE_FIPS else ()
+        return self.zones.get(code, ())
+
+    def counties(self, code: str) -> Tuple[str, ...]:
+        if code not in self.codes:
+            self.codes[code] = self.resolve(code)
+        return self.codes[code]
+
+    def fips_series(self, codes: pd.Series) -> pd.Series:
+        # Resolve a column of codes to tuples of county FIPS; each distinct code is looked up once
+        resolved = {code: self.counties(code) for code in codes.dropna().unique()}
+        return codes.map(resolved)
+
+def load_zone_table(path: str) -> Dict[str, Tuple[str, ...]]:
+    # STATE|ZONE|CWA|NAME|STATE_ZONE|COUNTY|FIPS|... -> {"TNZ005": ("47181", ...)}
+    zones: Dict[str, list] = {}
+    with open(path, newline="") as f:
+        for row in csv.reader(f, delimiter="|"):
+            if len(row) > 6 and row[6].isdigit():
+                zones.setdefault(f"{row[0]}Z{row[1].zfill(3)}", []).append(row[6].zfill(5))
+    return {zone: tuple(dict.fromkeys(fips)) for zone, fips in zones.items()}
+
+@lru_cache(maxsize=1)
+def load_alert_areas(zone_file: str = ZONE_FILE) -> AlertAreas:
+    # Zone-only alerts (no SAME codes) are only expanded when the correlation file is present
+    if not os.path.exists(zone_file):
+        return AlertAreas()
+    return AlertAreas(load_zone_table(zone_file))
+
+def county_names() -> Dict[str, str]:
+    # FIPS -> "Wayne County, TN" from the gazetteer, or an empty map when the NRI table is missing or unreadable
+    # (parse_fema_nri may still be writing it); callers then name counties from the alert's areaDesc
+    from parse_fema_nri import ZIP_FILENAME
+    if not os.path.exists(ZIP_FILENAME):
+        print(f"{ZIP_FILENAME} not found (run parse_fema_nri first); counties are named from the alerts' areaDesc.")
+        return {}
+    try:
+        return load_gazetteer().names
+    except Exception as e:
+        print(f"County names unavailable ({e!r}); counties are named from the alerts' areaDesc.")
+        return {}
@@ -0,0 +1,193 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from record_sinks import ParquetSink, flatten
+
+# Append-only historical store for every run's outputs: datasets/<DATASET>/run_date=<yyyy-mm-dd>/<run_id>.parquet
+# (zstd Parquet, one file per output) plus a manifest line per file. main.py archives each step's outputs here,
+# and history queries prune by run_date directory instead of globbing and re-parsing timestamped CSVs.
+# Usage: python dataset_store.py alerts-per-county [--days 90] | runs [DATASET] | ingest FILE...
+
+# Set Globals
+DATASET_ROOT: Path = Path(os.environ.get('DATASET_ROOT', 'datasets'))         # Root of the partitioned store
+MANIFEST_NAME: str = 'manifest.jsonl'                                          # One line per archived output
+OUTPUT_NAME = re.compile(r'^(?P<dataset>.+)_(?P<run_id>\d{8}T\d{6})\.(?P<ext>csv|jsonl|parquet)$', re.IGNORECASE)
+STRING_COLUMNS = re.compile(r'(FIPS|ID)$', re.IGNORECASE)                      # Codes whose leading zeros must survive type inference
+
+
+def parse_output_name(path: Path) -> Optional[Dict[str, str]]:
+    # FEMA_NRI_CFLD_20261017T035911.CSV -> {"dataset": "FEMA_NRI_CFLD", "run_id": "20261017T035911", "ext": "csv"}
+    match = OUTPUT_NAME.match(path.name)
+    if match is None:
+        return None
+    parts = match.groupdict()
+    parts["ext"] = parts["ext"].lower()
+    return parts
+
+def read_output(path: Path, ext: str) -> pa.Table:
+    if ext == "parquet":
+        return pq.read_table(path)
+    if path.stat().st_size == 0:
+        return pa.table({})
+    if ext == "csv":
+        with open(path, newline="") as f:
+            header = next(csv.reader(f), [])
+        types = {column: pa.string() for column in header if STRING_COLUMNS.search(column)}
+        return pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(column_types=types))
+    # JSON Lines: nested objects are flattened and lists kept as JSON strings, as ParquetSink writes them
+    with open(path) as f:
+        rows = [
+            {key: json.dumps(value) if isinstance(value, (list, dict)) else value for key, value in flatten(json.loads(line)).items()}
+            for line in f if line.strip()
+        ]
+    return pa.Table.from_pylist(rows)
+
+class DatasetStore:
+    """
+    Partitioned Parquet datasets with an append-only manifest. An output file
+    is archived at most once (keyed by its name), so re-archiving a run's
+    outputs is harmless.
+    """
+
+    def __init__(self, root: Path = DATASET_ROOT):
+        self.root = root
+        self.manifest_path = root / MANIFEST_NAME
+
+    def manifest(self) -> Iterator[Dict[str, Any]]:
+        if not self.manifest_path.exists():
+            return
+        with open(self.manifest_path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def archived(self) -> Dict[str, Dict[str, Any]]:
+        # Manifest entries keyed by the output file name they came from
+        return {entry["output"]: entry for entry in self.manifest()}
+
+    def partition(self, dataset: str, run_date: str) -> Path:
+        return self.root / dataset / f"run_date={run_date}"
+
+    def ingest(self, output: Path, step: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Archives one timestamped output file and returns its manifest entry
+        (the existing one if it was archived before). Returns None for files
+        that are not run outputs.
+        """
+        parts = parse_output_name(output)
+        if parts is None:
+            return None
+        previous = self.archived().get(output.name)
+        if previous is not None:
+            return previous
+        run_date = datetime.strptime(parts["run_id"], "%Y%m%dT%H%M%S").date().isoformat()
+        table = read_output(output, parts["ext"])
+        table = table.append_column("run_id", pa.array([parts["run_id"]] * table.num_rows, pa.string()))
+        target = self.partition(parts["dataset"], run_date) / f"{parts['run_id']}.parquet"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, target.with_suffix(".tmp"), compression="zstd")
+        os.replace(target.with_suffix(".tmp"), target)
+        entry = {
+            "dataset": parts["dataset"],
+            "run_id": parts["run_id"],
+            "run_date": run_date,
+            "step": step,
+            "output": output.name,
+            "path": str(target.relative_to(self.root)),
+            "rows": table.num_rows,
+            "bytes": target.stat().st_size,
+            "schema": {field.name: str(field.type) for field in table.schema},
+            "archived": time.time(),
+        }
+        with open(self.manifest_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def files(self, dataset: str, since: Optional[str] = None, until: Optional[str] = None) -> List[Path]:
+        # Partition pruning: only run_date directories inside [since, until] are listed
+        base = self.root / dataset
+        if not base.exists():
+            return []
+        files: List[Path] = []
+        for partition in sorted(base.glob("run_date=*")):
+            run_date = partition.name.partition("=")[2]
+            if (since and run_date < since) or (until and run_date > until):
+                continue
+            files.extend(sorted(partition.glob("*.parquet")))
+        return files
+
+    def scan(self, dataset: str, since: Optional[str] = None, until: Optional[str] = None, columns: Optional[List[str]] = None) -> pa.Table:
+        """
+        Reads a dataset's runs between since and until (inclusive yyyy-mm-dd
+        run dates). Only the requested columns' types are unified across runs,
+        so columns added later read as nulls in older runs, and a column whose
+        inferred type drifted between runs (int64 in one, string in another)
+        is widened, to string if nothing narrower holds both.
+        """
+        files = self.files(dataset, since, until)
+        if not files:
+            return pa.table({column: pa.array([], pa.string()) for column in columns or []})
+        types: Dict[str, Any] = {}
+        for file in files:
+            for field in pq.read_schema(file):
+                if columns is None or field.name in columns:
+                    types[field.name] = ParquetSink.widen(types[field.name], field.type) if field.name in types else field.type
+        schema = pa.schema(list(types.items()))
+        runs = ds.dataset([str(file) for file in files], schema=schema, format="parquet")
+        return runs.to_table(columns=[column for column in columns if column in types] if columns else None)
+
+def alerts_per_county(store: DatasetStore, days: int = 90, today: Optional[date] = None) -> Any:
+    # Distinct NWS alerts per county over the last `days` days of runs, most alerted first
+    since = ((today or date.today()) - timedelta(days=days)).isoformat()
+    table = store.scan("NWS_ALERTS", since=since, columns=["FIPS", "Place Names", "AlertId"])
+    frame = table.to_pandas()
+    if frame.empty:
+        return frame
+    frame["County"] = frame["FIPS"].fillna(frame["Place Names"])
+    counts = frame.drop_duplicates(["AlertId", "County"]).groupby("County").agg(
+        Alerts=("AlertId", "nunique"), **{"Place Names": ("Place Names", "first")}
+    )
+    return counts.sort_values("Alerts", ascending=False).reset_index()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Archive run outputs into the partitioned dataset store and query their history.")
+    parser.add_argument("--root", type=Path, default=DATASET_ROOT, help=f"Store root (default: {DATASET_ROOT})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Archive timestamped output files")
+    ingest.add_argument("files", nargs="+", type=Path)
+    runs = commands.add_parser("runs", help="List archived runs from the manifest")
+    runs.add_argument("dataset", nargs="?")
+    alerts = commands.add_parser("alerts-per-county", help="Distinct NWS alerts per county over recent runs")
+    alerts.add_argument("--days", type=int, default=90, help="Look back this many days (default: 90)")
+    args = parser.parse_args(argv)
+
+    store = DatasetStore(args.root)
+    if args.command == "ingest":
+        for file in args.files:
+            entry = store.ingest(file)
+            print(f"{file}: not a run output" if entry is None else f'{file}: {entry["rows"]} rows in {entry["path"]}')
+    elif args.command == "runs":
+        for entry in store.manifest():
+            if args.dataset in (None, entry["dataset"]):
+                print(f'{entry["dataset"]:<24} {entry["run_id"]}  {entry["rows"]:>8} rows  {entry["bytes"] / 1024:>9.1f} KiB  {entry["path"]}')
+    else:
+        counts = alerts_per_county(store, args.days)
+        print(counts.to_string(index=False) if len(counts) else f"No NWS_ALERTS runs in the last {args.days} days.")
+    return 0
+
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
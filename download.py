@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+from email.utils import formatdate
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+# Conditional, resumable downloads for large static archives (e.g. the FEMA NRI zip).
+# Usage: download(url, path, session) -> True when new content was written to path.
+
+# Set Globals
+CHUNK_SIZE: int = 1024 * 1024                                           # Bytes per read/write
+
+
+def meta_path(path: str) -> str:
+    return f"{path}.meta.json"
+
+def read_meta(path: str) -> Dict[str, Any]:
+    try:
+        with open(meta_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_meta(path: str, meta: Dict[str, Any]) -> None:
+    with open(meta_path(path), "w") as f:
+        json.dump(meta, f, indent=2)
+
+def validators(response: requests.Response) -> Dict[str, Optional[str]]:
+    return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def download(url: str, path: str, session: requests.Session, validate: Optional[Callable[[str], bool]] = None, timeout: float = 60) -> bool:
+    """
+    Downloads url to path, returning False when the local copy is still current.
+    - A complete local copy is revalidated with If-None-Match / If-Modified-Since.
+    - An interrupted download (path.part) is resumed with a Range request, guarded
+      by If-Range so a newer release restarts the download instead of corrupting it.
+      A 416 reply means the part already ends at (or past) the end of the file: a
+      part of exactly the release's size is finalized, any other is restarted.
+    - Bytes go to path.part and replace path only after the size (and the optional
+      validate(part_path) check) succeed.
+    The ETag, Last-Modified, size and SHA-256 are kept in path.meta.json.
+    """
+    meta = read_meta(path)
+    part = f"{path}.part"
+    part_meta = read_meta(part)
+    # Sizes are checked against Content-Length, so ask for the bytes as stored
+    headers: Dict[str, str] = {"Accept-Encoding": "identity"}
+
+    if os.path.exists(path) and os.path.getsize(path) == meta.get("size"):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    elif os.path.exists(path) and not meta:
+        # Copy from before metadata was kept: revalidate against its modification time
+        headers["If-Modified-Since"] = formatdate(os.path.getmtime(path), usegmt=True)
+
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if offset and (part_meta.get("etag") or part_meta.get("last_modified")):
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = part_meta.get("etag") or part_meta["last_modified"]
+    else:
+        offset = 0
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return False
+        if response.status_code == 416 and offset:
+            # Range starts at the end of the file: the part is complete if it holds every byte (Content-Range: bytes */total)
+            total = int(response.headers.get("Content-Range", "").rpartition("/")[2] or 0) or None
+            complete = total == offset
+        else:
+            response.raise_for_status()
+            complete = False
+
+        if response.status_code == 416:
+            if not complete:
+                print(f"Discarding {part}: {offset} bytes do not match the {total or 'unknown'}-byte release; restarting.")
+            release = part_meta
+        elif response.status_code == 206:
+            # Content-Range: bytes start-end/total
+            total = int(response.headers.get("Content-Range", "").rpartition("/")[2] or 0) or None
+            print(f"Resuming {path} at {offset} bytes...")
+        else:
+            # Full body: the server ignored Range or the release changed since the partial download
+            offset = 0
+            total = int(response.headers["Content-Length"]) if "Content-Length" in response.headers else None
+            write_meta(part, validators(response))
+
+        if response.status_code != 416:
+            with open(part, "ab" if offset else "wb", buffering=CHUNK_SIZE) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+            release = validators(response) if response.status_code == 200 else part_meta
+
+    if response.status_code == 416 and not complete:
+        os.remove(part)
+        os.remove(meta_path(part))
+        return download(url, path, session, validate, timeout)
+
+    size = os.path.getsize(part)
+    if total is not None and size != total:
+        raise IOError(f"Incomplete download of {url}: {size} of {total} bytes")
+    if validate is not None and not validate(part):
+        os.remove(part)
+        os.remove(meta_path(part))
+        raise IOError(f"Downloaded {url} failed validation")
+
+    os.replace(part, path)
+    os.remove(meta_path(part))
+    write_meta(path, {**release, "size": size, "sha256": file_digest(path)})
+    return True
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Persistent HTTP response cache shared by every source.
+# Usage: install_cache(session, DATA_SOURCE, ttl=CACHE_TTL) after the session adapters are mounted.
+
+# Set Globals
+CACHE_PATH: str = os.environ.get('HTTP_CACHE_PATH', '.cache/http_cache.sqlite')             # SQLite database file
+CACHE_MAX_BYTES: int = int(os.environ.get('HTTP_CACHE_MAX_BYTES', 512 * 1024 * 1024))       # Byte budget before LRU eviction
+CACHE_MODES = ("on", "off", "refresh")                                                      # off: bypass, refresh: fetch and overwrite
+CREDENTIAL_PARAMS = ("key", "api_key", "apikey", "token", "access_token")                   # Query parameters never hashed or stored
+SCHEMA_VERSION: int = 1                                                                     # 1: URLs stored without credentials
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    reason TEXT,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+def redact_url(url: str) -> str:
+    # Drops API keys from the query string, so they are neither stored nor part of the cache key
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    kept = [(name, value) for name, value in params if name.lower() not in CREDENTIAL_PARAMS]
+    if len(kept) == len(params):
+        return url
+    return urlunsplit(parts._replace(query=urlencode(kept)))
+
+def cache_mode() -> str:
+    # Read on every request so main.py (or a caller) can switch modes at runtime
+    mode = os.environ.get('HTTP_CACHE', 'on').lower()
+    return mode if mode in CACHE_MODES else "on"
+
+class ResponseCache:
+    """
+    Disk-backed store of GET responses keyed by method, URL and Accept header.
+    Credential parameters (CREDENTIAL_PARAMS) are removed from the URL before
+    it is hashed or stored. Entries expire per lookup TTL and the least
+    recently used are evicted once the total body size exceeds max_bytes.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self.scrub()
+
+    def scrub(self) -> None:
+        # Caches written before credentials were redacted: drop the entries whose URL carries one
+        with self.lock:
+            stale = [(key,) for key, url in self.conn.execute("SELECT key, url FROM responses").fetchall() if redact_url(url) != url]
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.conn.commit()
+            if stale:
+                # Deleted rows linger in free pages until the file is rebuilt
+                self.conn.execute("VACUUM")
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    @staticmethod
+    def make_key(request: requests.PreparedRequest) -> str:
+        return ResponseCache.url_key(request.method, request.url, request.headers.get("Accept", ""))
+
+    @staticmethod
+    def url_key(method: str, url: str, accept: str = "") -> str:
+        return hashlib.sha256(f"{method} {redact_url(url)} {accept}".encode()).hexdigest()
+
+    def get(self, key: str, ttl: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT url, status, reason, headers, body FROM responses WHERE key = ? AND created > ?",
+                (key, now - ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        url, status, reason, headers, body = row
+        return {"url": url, "status": status, "reason": reason, "headers": json.loads(headers), "body": body}
+
+    def set(self, key: str, namespace: str, response: requests.Response) -> None:
+        self.put(key, namespace, response.url, response.status_code, response.reason, dict(response.headers), response.content)
+
+    def put(self, key: str, namespace: str, url: str, status: int, reason: Optional[str], headers: Dict[str, str], body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, namespace, redact_url(url), status, reason, json.dumps(headers), body, len(body), now, now),
+            )
+            self.evict()
+            self.conn.commit()
+
+    def evict(self) -> None:
+        # Drop least recently used entries until the cache fits its byte budget (caller holds the lock)
+        total: int = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall():
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        with self.lock:
+            if namespace is None:
+                self.conn.execute("DELETE FROM responses")
+            else:
+                self.conn.execute("DELETE FROM responses WHERE namespace = ?", (namespace,))
+            self.conn.commit()
+
+class CacheAdapter(BaseAdapter):
+    """
+    Transport adapter that answers GETs from a ResponseCache and otherwise
+    delegates to the wrapped adapter (keeping its retry policy). Without a
+    cache, the shared one is opened on the first GET, not at session creation.
+    """
+
+    def __init__(self, adapter: BaseAdapter, cache: Optional[ResponseCache], namespace: str, ttl: float):
+        super().__init__()
+        self.adapter = adapter
+        self._cache = cache
+        self.namespace = namespace
+        self.ttl = ttl
+
+    @property
+    def cache(self) -> ResponseCache:
+        if self._cache is None:
+            self._cache = get_cache()
+        return self._cache
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        mode = cache_mode()
+        if request.method != "GET" or mode == "off" or self.ttl <= 0:
+            return self.adapter.send(request, **kwargs)
+
+        key = ResponseCache.make_key(request)
+        if mode != "refresh":
+            hit = self.cache.get(key, self.ttl)
+            if hit is not None:
+                return build_response(request, hit)
+
+        response = self.adapter.send(request, **kwargs)
+        response.from_cache = False
+        if response.status_code == 200:
+            self.cache.set(key, self.namespace, response)
+        return response
+
+    def close(self) -> None:
+        self.adapter.close()
+
+def build_response(request: requests.PreparedRequest, hit: Dict[str, Any]) -> requests.Response:
+    response = requests.Response()
+    response.status_code = hit["status"]
+    response.reason = hit["reason"]
+    response.headers = CaseInsensitiveDict(hit["headers"])
+    response.url = hit["url"]
+    response.request = request
+    response._content = hit["body"]
+    response._content_consumed = True
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.from_cache = True
+    return response
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+def install_cache(session: requests.Session, namespace: str, ttl: float, prefixes=("https://",)) -> requests.Session:
+    # Wrap the adapters already mounted on the session so retries still apply to cache misses
+    for prefix in prefixes:
+        session.mount(prefix, CacheAdapter(session.get_adapter(prefix), None, namespace, ttl))
+    return session
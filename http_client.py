@@ -0,0 +1,121 @@
+import os
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3.util.retry import Retry
+
+from http_cache import install_cache
+from http_metrics import METRICS, InstrumentedRetry, install_metrics
+from rate_control import RateLimitedAdapter
+
+# Shared HTTP client for every source: pooled keep-alive sessions with retries and default timeouts.
+# Usage: session = create_session(DATA_SOURCE, headers=HEADERS, pools={"https://api.example.com/": 8})
+
+# Set Globals
+DEFAULT_TIMEOUT: Tuple[float, float] = (10, 60)                         # (connect, read) seconds
+DEFAULT_POOL_SIZE: int = 10                                             # Keep-alive connections per host
+DEFAULT_STATUS_FORCELIST: List[int] = [502, 503, 504, 429, 403]         # Retry on these HTTP status codes
+THROTTLE_STATUSES: List[int] = [429, 403]                               # Left to the rate controller when it is on
+RATE_CONTROL: bool = os.environ.get('HTTP_RATE_CONTROL', 'on').lower() != 'off'   # Adaptive per-host rate control (see rate_control.py)
+STANDIN_URL: Optional[str] = os.environ.get('HTTP_STANDIN_URL')         # Send every request to a local stand-in server (see benchmark.py)
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+def build_retry(total: int = 10, backoff_factor: float = 3, status_forcelist: List[int] = DEFAULT_STATUS_FORCELIST, backoff_max: float = 60) -> Retry:
+    # Define the retry strategy (retries and backoff sleeps are reported to http_metrics)
+    return InstrumentedRetry(
+        total=total,                                # Maximum retries
+        backoff_factor=backoff_factor,              # Exponential backoff (1s, 2s, 4s, etc.)
+        status_forcelist=status_forcelist,          # Retry on these HTTP status codes
+        allowed_methods=["GET"],                    # Apply retry only to GET requests
+        backoff_max=backoff_max                     # Maximum backoff time between retries
+    )
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies a default (connect, read) timeout to every request
+    that does not pass its own, so no socket can hang forever.
+    """
+
+    def __init__(self, *args, timeout: Timeout = DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=self.timeout if timeout is None else timeout, **kwargs)
+
+def standin_url(url: str, base_url: str) -> str:
+    # https://host/path?query -> <base_url>/host/path?query
+    parts = urlsplit(url)
+    return f"{base_url.rstrip('/')}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+class StandInAdapter(BaseAdapter):
+    """
+    Rewrites https://host/path?query to <STANDIN_URL>/host/path?query, so a run
+    can be replayed against a local server without touching the sources.
+    """
+
+    def __init__(self, base_url: str, adapter: BaseAdapter):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        # Rewrite a copy: the rate controller may resend the original request
+        request = request.copy()
+        request.url = standin_url(request.url, self.base_url)
+        return self.adapter.send(request, **kwargs)
+
+    def close(self):
+        self.adapter.close()
+
+def create_session(
+    source: str,
+    headers: Optional[Dict[str, str]] = None,
+    pools: Optional[Dict[str, int]] = None,
+    retries: Optional[Retry] = None,
+    timeout: Timeout = DEFAULT_TIMEOUT,
+    cache_ttl: float = 0,
+    rate_control: bool = RATE_CONTROL,
+    metrics: bool = METRICS,
+) -> requests.Session:
+    """
+    Builds a session for one source.
+    pools maps URL prefixes (e.g. "https://ridb.recreation.gov/") to their
+    keep-alive pool size; other hosts get DEFAULT_POOL_SIZE. A cache_ttl above
+    zero serves repeat GETs from the shared disk cache (see http_cache.py).
+    With rate_control, throttling statuses are handled by the per-host rate
+    controller instead of blind urllib3 retries. With metrics, every request
+    is timed and counted per endpoint (see http_metrics.py). With HTTP_STANDIN_URL set,
+    every request goes to that server instead (see StandInAdapter).
+    """
+    retries = retries or build_retry()
+    if rate_control:
+        # urllib3 would otherwise retry Retry-After responses itself, hiding them from the controller
+        retries = retries.new(
+            status_forcelist=[status for status in retries.status_forcelist or [] if status not in THROTTLE_STATUSES],
+            respect_retry_after_header=False,
+        )
+
+    def make_adapter(pool_size: int) -> BaseAdapter:
+        adapter = TimeoutHTTPAdapter(max_retries=retries, pool_maxsize=pool_size, timeout=timeout)
+        if STANDIN_URL:
+            adapter = StandInAdapter(STANDIN_URL, adapter)
+        return RateLimitedAdapter(adapter) if rate_control else adapter
+
+    session = requests.Session()
+    prefixes: List[str] = ["https://", "http://"]
+    for prefix in prefixes:
+        session.mount(prefix, make_adapter(DEFAULT_POOL_SIZE))
+    for prefix, pool_size in (pools or {}).items():
+        session.mount(prefix, make_adapter(pool_size))
+        prefixes.append(prefix)
+    session.headers.update({"Connection": "keep-alive", **(headers or {})})
+    if cache_ttl > 0:
+        install_cache(session, source, ttl=cache_ttl, prefixes=prefixes)
+    if metrics:
+        install_metrics(session, source, prefixes=prefixes)
+    return session
@@ -0,0 +1,291 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from urllib3.util.retry import Retry
+
+# Per-request network instrumentation for every session built by http_client.create_session.
+# Each request records latency, bytes, status, retries, backoff and rate-limiter queueing per (source, endpoint).
+# report(source) summarizes a source on stdout and exports <HTTP_METRICS_DIR>/<source>.prom (Prometheus text) and .json;
+# runners call it as each source finishes, and sources never reported (standalone scripts) are reported at exit.
+
+# Set Globals
+METRICS: bool = os.environ.get('HTTP_METRICS', 'on').lower() != 'off'      # Instrument sessions and export at exit
+METRICS_DIR: str = os.environ.get('HTTP_METRICS_DIR', 'metrics')           # Where the .prom and .json reports go
+METRIC_PREFIX: str = 'storm_chaser_http'
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)   # Histogram bounds in seconds
+ID_SEGMENT = re.compile(r'^(\d+|[0-9a-f]{8}-[0-9a-f-]{27}|urn:oid:[\d.]+)$', re.IGNORECASE)
+
+_local = threading.local()
+
+
+def endpoint_label(url: str) -> str:
+    # host/path with IDs collapsed, so /facilities/123 and /facilities/456 share an endpoint
+    parts = urlsplit(url)
+    path = "/".join("{id}" if ID_SEGMENT.match(segment) else segment for segment in parts.path.split("/"))
+    return f"{parts.netloc}{path}"
+
+def active() -> Optional[Dict[str, float]]:
+    # Counters for the request this thread is sending, if it is being instrumented
+    return getattr(_local, "request", None)
+
+def record_retry(backoff: float = 0.0) -> None:
+    request = active()
+    if request is not None:
+        request["retries"] += 1
+        request["backoff"] += backoff
+
+def record_backoff(seconds: float) -> None:
+    request = active()
+    if request is not None:
+        request["backoff"] += seconds
+
+def record_queue(seconds: float) -> None:
+    request = active()
+    if request is not None:
+        request["queue"] += seconds
+
+class InstrumentedRetry(Retry):
+    """
+    urllib3 Retry that reports each retry and the time slept before it.
+    """
+
+    def increment(self, *args, **kwargs) -> Retry:
+        retry = super().increment(*args, **kwargs)
+        record_retry()
+        return retry
+
+    def sleep(self, response=None) -> None:
+        start = time.perf_counter()
+        super().sleep(response)
+        record_backoff(time.perf_counter() - start)
+
+class EndpointStats:
+    """
+    Running totals and latency samples for one (source, endpoint).
+    """
+
+    def __init__(self):
+        self.statuses: Counter = Counter()
+        self.latencies: List[float] = []
+        self.buckets: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.bytes = 0
+        self.retries = 0
+        self.backoff = 0.0
+        self.queue = 0.0
+        self.cache_hits = 0
+
+    def add(self, status: str, latency: float, size: int, retries: int, backoff: float, queue: float, cached: bool) -> None:
+        self.statuses[status] += 1
+        self.latencies.append(latency)
+        self.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.bytes += size
+        self.retries += retries
+        self.backoff += backoff
+        self.queue += queue
+        self.cache_hits += int(cached)
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "requests": self.count,
+            "statuses": dict(self.statuses),
+            "errors": sum(count for status, count in self.statuses.items() if not status.startswith(("2", "3"))),
+            "latency_total": round(sum(self.latencies), 6),
+            "latency_p50": round(self.percentile(0.5), 6),
+            "latency_p95": round(self.percentile(0.95), 6),
+            "latency_max": round(max(self.latencies, default=0.0), 6),
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "backoff_seconds": round(self.backoff, 6),
+            "queue_seconds": round(self.queue, 6),
+            "cache_hits": self.cache_hits,
+        }
+
+class MetricsRegistry:
+    """
+    (source, endpoint) -> EndpointStats for this process, shared by every instrumented session.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints: Dict[Tuple[str, str], EndpointStats] = {}
+        self.reported: set = set()
+        self.started = time.time()
+
+    def observe(self, source: str, endpoint: str, **sample) -> None:
+        with self.lock:
+            stats = self.endpoints.setdefault((source, endpoint), EndpointStats())
+            stats.add(**sample)
+
+    def sources(self) -> List[str]:
+        with self.lock:
+            return sorted({source for source, _ in self.endpoints})
+
+    def unreported(self) -> List[str]:
+        with self.lock:
+            return sorted({source for source, _ in self.endpoints} - self.reported)
+
+    def report(self, source: str) -> Dict[str, Any]:
+        with self.lock:
+            endpoints = {endpoint: stats.summary() for (name, endpoint), stats in sorted(self.endpoints.items()) if name == source}
+        return {"source": source, "started": self.started, "finished": time.time(), "endpoints": endpoints}
+
+    def prometheus(self, source: str) -> str:
+        # Prometheus text exposition format, one file per source (suits the node_exporter textfile collector)
+        lines = [
+            f"# HELP {METRIC_PREFIX}_requests_total HTTP requests by final status.",
+            f"# TYPE {METRIC_PREFIX}_requests_total counter",
+        ]
+        with self.lock:
+            items = [(endpoint, stats) for (name, endpoint), stats in sorted(self.endpoints.items()) if name == source]
+        for endpoint, stats in items:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'{METRIC_PREFIX}_requests_total{{source="{source}",endpoint="{endpoint}",status="{status}"}} {count}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_request_duration_seconds Request latency, including retries and backoff.",
+            f"# TYPE {METRIC_PREFIX}_request_duration_seconds histogram",
+        ]
+        for endpoint, stats in items:
+            labels = f'source="{source}",endpoint="{endpoint}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative += count
+                lines.append(f'{METRIC_PREFIX}_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_PREFIX}_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+            lines.append(f'{METRIC_PREFIX}_request_duration_seconds_sum{{{labels}}} {sum(stats.latencies):.6f}')
+            lines.append(f'{METRIC_PREFIX}_request_duration_seconds_count{{{labels}}} {stats.count}')
+        for name, kind, help_text, value in (
+            ("response_bytes_total", "counter", "Response body bytes received.", lambda s: s.bytes),
+            ("retries_total", "counter", "Retries by urllib3 or the rate controller.", lambda s: s.retries),
+            ("backoff_seconds_total", "counter", "Time slept between retries.", lambda s: f"{s.backoff:.6f}"),
+            ("queue_seconds_total", "counter", "Time waiting for the per-host rate limiter.", lambda s: f"{s.queue:.6f}"),
+            ("cache_hits_total", "counter", "Responses served from the HTTP cache.", lambda s: s.cache_hits),
+        ):
+            lines += [f"# HELP {METRIC_PREFIX}_{name} {help_text}", f"# TYPE {METRIC_PREFIX}_{name} {kind}"]
+            for endpoint, stats in items:
+                lines.append(f'{METRIC_PREFIX}_{name}{{source="{source}",endpoint="{endpoint}"}} {value(stats)}')
+        return "\n".join(lines) + "\n"
+
+    def print_summary(self, source: str) -> None:
+        report = self.report(source)
+        print(f"\n{'Endpoint':<56} {'Reqs':>6} {'Errs':>5} {'p50(s)':>7} {'p95(s)':>7} {'Max(s)':>7} {'MiB':>7} {'Retries':>7} {'Backoff(s)':>10} {'Queue(s)':>9}")
+        for endpoint, s in report["endpoints"].items():
+            print(f'{endpoint[:56]:<56} {s["requests"]:>6} {s["errors"]:>5} {s["latency_p50"]:>7.3f} {s["latency_p95"]:>7.3f} {s["latency_max"]:>7.3f} '
+                  f'{s["bytes"] / 2**20:>7.2f} {s["retries"]:>7} {s["backoff_seconds"]:>10.2f} {s["queue_seconds"]:>9.2f}')
+
+    def export(self, directory: str = METRICS_DIR, sources: Optional[List[str]] = None) -> List[str]:
+        # Written through a temporary file so collectors never read a partial report
+        os.makedirs(directory, exist_ok=True)
+        written: List[str] = []
+        for source in self.sources() if sources is None else sources:
+            for suffix, content in (("prom", self.prometheus(source)), ("json", json.dumps(self.report(source), indent=2))):
+                path = os.path.join(directory, f"{source}.{suffix}")
+                with open(f"{path}.tmp", "w") as f:
+                    f.write(content)
+                os.replace(f"{path}.tmp", path)
+                written.append(path)
+        return written
+
+registry = MetricsRegistry()
+
+def export(source: Optional[str] = None, directory: str = METRICS_DIR) -> List[str]:
+    # Writes the .prom and .json reports of one source (or every source); returns their paths
+    return registry.export(directory, None if source is None else [source])
+
+def report(source: str) -> List[str]:
+    """
+    Prints a source's network summary and exports its reports; returns the
+    files written. Called by runners when the source finishes; a reported
+    source is left out of the exit report.
+    """
+    if source not in registry.sources():
+        return []
+    with registry.lock:
+        registry.reported.add(source)
+    print(f"--- {source} network summary ---")
+    registry.print_summary(source)
+    try:
+        written = export(source)
+    except OSError as e:
+        print(f"Could not save network metrics: {e}")
+        return []
+    print(f"--- Network metrics saved to {', '.join(written)} ---")
+    return written
+
+def report_at_exit() -> None:
+    # Fallback for scripts run on their own: report whatever no runner has reported
+    for source in registry.unreported():
+        report(source)
+
+_exit_hook = threading.Lock()
+_exit_registered = False
+
+def register_exit_report() -> None:
+    global _exit_registered
+    with _exit_hook:
+        if not _exit_registered:
+            atexit.register(report_at_exit)
+            _exit_registered = True
+
+class MetricsAdapter(BaseAdapter):
+    """
+    Outermost transport adapter: times each request end to end (cache, rate
+    limiter, retries and, for non-streamed responses, the body) and files it
+    under its source and endpoint.
+    """
+
+    def __init__(self, adapter: BaseAdapter, source: str):
+        super().__init__()
+        self.adapter = adapter
+        self.source = source
+        register_exit_report()
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False, **kwargs) -> requests.Response:
+        _local.request = counters = {"retries": 0, "backoff": 0.0, "queue": 0.0}
+        start = time.perf_counter()
+        response: Optional[requests.Response] = None
+        size = 0
+        try:
+            response = self.adapter.send(request, stream=stream, **kwargs)
+            # Streamed bodies (downloads) are read by the caller; count what the server announced
+            size = int(response.headers.get("Content-Length") or 0) if stream else len(response.content)
+            return response
+        finally:
+            _local.request = None
+            registry.observe(
+                self.source,
+                endpoint_label(request.url),
+                status=str(response.status_code) if response is not None else "error",
+                latency=time.perf_counter() - start,
+                size=size,
+                retries=counters["retries"],
+                backoff=counters["backoff"],
+                queue=counters["queue"],
+                cached=bool(getattr(response, "from_cache", False)),
+            )
+
+    def close(self) -> None:
+        self.adapter.close()
+
+def install_metrics(session: requests.Session, source: str, prefixes=("https://",)) -> requests.Session:
+    # Wrap the adapters already mounted on the session, outside the cache and rate controller
+    for prefix in prefixes:
+        session.mount(prefix, MetricsAdapter(session.get_adapter(prefix), source))
+    return session
@@ -0,0 +1,105 @@
+import glob
+import os
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from county_index import Gazetteer, load_gazetteer
+from profiling import PROFILE_FLAG, run_profiled, stage
+from record_sinks import EXTENSIONS
+
+# Join the latest NRI risk, NASS land price and NWS alert outputs into one county-level dataset keyed on FIPS.
+# Usage: python join_counties.py [nass_output] [nws_output] [--profile]
+
+# Set Globals
+DATA_SOURCE: str = 'COUNTY_JOIN'                                        # Name of data source
+TIMESTAMP: str = f'{datetime.now():%Y%m%dT%H%M%S}'                      # Current timestamp
+OUTPUT_CSV: str = f'{DATA_SOURCE}_{TIMESTAMP}.csv'                      # Output filename
+NASS_PATTERN: str = 'NASS_USDA_*.*'                                     # parse_usda_nass.py outputs (any OUTPUT_FORMAT)
+NWS_PATTERN: str = 'NWS_ALERTS_*.*'                                     # parse_nws_alerts.py outputs (any OUTPUT_FORMAT)
+NASS_COLUMNS: List[str] = ["PP_ACRE", "ZONE", "FOCUS_AREA", "LANDWATCH_URL"]
+
+
+def latest_output(pattern: str) -> Optional[str]:
+    # Outputs are timestamped, so the newest sorts last; only files a record sink could have written count
+    files = sorted(path for path in glob.glob(pattern) if os.path.splitext(path)[1].lstrip(".") in EXTENSIONS.values())
+    return files[-1] if files else None
+
+def read_table(path: str, dtype: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    # Reads an output in whichever format record_sinks wrote it
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".jsonl"):
+        return pd.read_json(path, lines=True, dtype=dtype)
+    return pd.read_csv(path, dtype=dtype)
+
+def fips_index(df: pd.DataFrame, fips: pd.Series, label: str) -> pd.DataFrame:
+    unmatched = df.loc[fips.isna(), "Place Names"].unique().tolist()
+    if unmatched:
+        print(f"{label}: {len(unmatched)} place names not in the gazetteer: {', '.join(map(str, unmatched[:20]))}")
+    return df.assign(FIPS=fips).dropna(subset=["FIPS"])
+
+def load_nri_risk() -> pd.DataFrame:
+    from parse_fema_nri import CSV_FILE, ZIP_FILENAME, get_selected_columns, load_nri
+    nri = load_nri(ZIP_FILENAME, CSV_FILE, ["STCOFIPS"] + get_selected_columns())
+    nri["FIPS"] = nri.pop("STCOFIPS").map(lambda fips: f"{int(fips):05d}")
+    return nri.set_index("FIPS")
+
+def load_nass(path: str, gazetteer: Gazetteer) -> pd.DataFrame:
+    nass = read_table(path)
+    nass = fips_index(nass, gazetteer.fips_series(nass["Place Names"]), "NASS")
+    # The county list may name a county twice; keep one row per FIPS
+    return nass.drop_duplicates("FIPS").set_index("FIPS")[NASS_COLUMNS]
+
+def load_nws(path: str, gazetteer: Gazetteer) -> pd.DataFrame:
+    nws = read_table(path, dtype={"FIPS": str})
+    # Alerts expanded through their UGC/SAME codes already carry FIPS; only name-only rows are resolved
+    fips = gazetteer.fips_series(nws["Place Names"])
+    if "FIPS" in nws:
+        fips = nws["FIPS"].str.zfill(5).fillna(fips)
+    nws = fips_index(nws, fips, "NWS")
+    return nws.groupby("FIPS").agg(
+        ALERT_COUNT=("Event", "size"),
+        ALERT_EVENTS=("Event", lambda events: "; ".join(sorted(set(events.dropna())))),
+    )
+
+def join_counties(nri: pd.DataFrame, nass: Optional[pd.DataFrame], nws: Optional[pd.DataFrame], gazetteer: Gazetteer) -> pd.DataFrame:
+    # Hash joins on the FIPS index; every NRI county is kept
+    joined = nri
+    if nass is not None:
+        joined = joined.join(nass, how="left")
+    if nws is not None:
+        joined = joined.join(nws, how="left")
+        joined["ALERT_COUNT"] = joined["ALERT_COUNT"].fillna(0).astype(int)
+    joined.insert(0, "Place Names", joined.index.map(gazetteer.names))
+    return joined.reset_index()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if PROFILE_FLAG in argv:
+        return run_profiled(DATA_SOURCE, main, [arg for arg in argv if arg != PROFILE_FLAG])
+    if argv and argv[0] in ["--help", "-h", "/?"]:
+        print(f"Usage: {os.path.basename(__file__)} [nass_output] [nws_output] [{PROFILE_FLAG}]")
+        return 0
+    nass_file = argv[0] if len(argv) > 0 else latest_output(NASS_PATTERN)
+    nws_file = argv[1] if len(argv) > 1 else latest_output(NWS_PATTERN)
+
+    gazetteer = load_gazetteer()
+    print(f"Joining NRI with {nass_file or 'no NASS output'} and {nws_file or 'no NWS output'} =>")
+    with stage("fetch"):
+        nri = load_nri_risk()
+        nass = load_nass(nass_file, gazetteer) if nass_file else None
+        nws = load_nws(nws_file, gazetteer) if nws_file else None
+    with stage("normalize"):
+        joined = join_counties(nri, nass, nws, gazetteer)
+    with stage("write"):
+        joined.to_csv(OUTPUT_CSV, index=False)
+    print(f"--- {DATA_SOURCE} data joined: {len(joined)} counties ---")
+    print(f"--- Saved to {OUTPUT_CSV} ---")
+    return 0
+
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,225 @@
 #!/usr/bin/env python3
+import argparse
+import glob
 import os
 from pathlib import Path
 import subprocess
 import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
+from profiling import PROFILE_DIR, PROFILE_FLAG
+from run_plan import RunState, plan, remote_versions, step_for
+from source_plugins import run_plugin, script_for
+from source_plugins import plugins as registered_plugins
+from source_plugins import sources as registered_sources
 
-def main():
-    # List all .py files in the current directory, excluding this script
-    py_files = [f for f in os.listdir('.') if f.endswith('.py') and f != sys.argv[0]]
+# Set Globals
+LOG_DIR: Path = Path('logs')                                            # Captured stdout/stderr, one file per source
+DEFAULT_JOBS: int = 4                                                   # Bounded worker pool size
+DEFAULT_TIMEOUT: float = 3600                                           # Per-source timeout in seconds
+POLL_INTERVAL: float = 0.1                                              # Seconds between child status checks
+OK_STATUSES = ("ok", "reused")                                          # Statuses that let downstream steps run
+RSS_UNITS: int = 1 if sys.platform == 'darwin' else 1024                # ru_maxrss is bytes on macOS, KiB elsewhere
+ARCHIVE: bool = os.environ.get('DATASET_ARCHIVE', 'on').lower() != 'off'   # Archive outputs into the dataset store (see dataset_store.py)
 
-    if not py_files:
-        print("No other Python files found to execute.")
-        return
 
-    for script in py_files:
-        print(f"Executing {script}...")
+def discover_sources(names: Optional[List[str]] = None) -> List[str]:
+    """
+    Returns every registered source plugin, or only the named plugins (stages
+    such as join_counties included) when names are given.
+    Raises ValueError for a name that is not a registered plugin.
+    """
+    # Only registered plugins run (see source_plugins.py); helper modules are never executed
+    if not names:
+        return registered_sources()
+    wanted = list(dict.fromkeys(Path(name).stem for name in names))
+    unknown = [name for name in wanted if name not in registered_plugins()]
+    if unknown:
+        raise ValueError(f"Unknown source or stage: {', '.join(unknown)} (choose from {', '.join(registered_plugins())})")
+    return wanted
+
+def wait_for(proc: subprocess.Popen, timeout: Optional[float]) -> Optional[Any]:
+    """
+    Waits for a child process and returns its resource usage (CPU time, peak RSS).
+    Raises subprocess.TimeoutExpired once the timeout elapses.
+    Returns None on platforms without os.wait4.
+    """
+    if not hasattr(os, 'wait4'):
+        proc.wait(timeout=timeout)
+        return None
+
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return usage
+        if deadline is not None and time.monotonic() >= deadline:
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        time.sleep(POLL_INTERVAL)
+
+def run_source(script: Path, timeout: Optional[float], cwd: Optional[Path] = None, env: Optional[Dict[str, str]] = None, log_dir: Path = LOG_DIR, args: Sequence[str] = ()) -> Dict[str, Any]:
+    # Run one source in its own interpreter, capturing its output to a log file
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_file = log_dir / f'{script.stem}.log'
+    result: Dict[str, Any] = {
+        "Source": script.stem,
+        "Status": "ok",
+        "ReturnCode": None,
+        "Wall": 0.0,
+        "CPU": None,
+        "MaxRSS": None,
+        "Log": str(log_file),
+    }
+    start = time.perf_counter()
+    with open(log_file, 'w') as log:
+        try:
+            proc = subprocess.Popen([sys.executable, str(script), *args], stdout=log, stderr=subprocess.STDOUT, text=True, cwd=cwd, env=env)
+        except OSError as e:
+            log.write(f"Failed to start {script}: {e}\n")
+            result["Status"] = "error"
+            return result
+        try:
+            usage = wait_for(proc, timeout)
+            if usage is not None:
+                result["CPU"] = usage.ru_utime + usage.ru_stime
+                result["MaxRSS"] = usage.ru_maxrss * RSS_UNITS           # Peak resident set size in bytes
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            result["Status"] = "timeout"
+        result["ReturnCode"] = proc.returncode
+    result["Wall"] = time.perf_counter() - start
+    if result["Status"] == "ok" and proc.returncode != 0:
+        result["Status"] = "failed"
+    return result
+
+def run_in_process(name: str, timeout: Optional[float], log_dir: Path = LOG_DIR, args: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Runs one plugin in this interpreter, capturing its output to a log file.
+    A running plugin cannot be interrupted: one that overruns its timeout is
+    reported as "timeout" once it returns (use --isolate to enforce timeouts).
+    """
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_file = log_dir / f'{name}.log'
+    with open(log_file, 'w') as log:
+        run = run_plugin(name, log, list(args))
+    result: Dict[str, Any] = {"Source": name, "Status": "ok", "MaxRSS": None, "Log": str(log_file), **run}
+    if timeout and result["Wall"] > timeout:
+        result["Status"] = "timeout"
+    elif result["ReturnCode"] != 0:
+        result["Status"] = "failed"
+    return result
+
+def archive_outputs(name: str, outputs: List[str], prune: bool = False) -> None:
+    """
+    Archives a step's outputs into the dataset store, along with any earlier
+    outputs of the step still lying around. Files are left in place unless
+    prune is set, in which case the earlier ones are deleted once archived
+    and only the latest run's files stay in the working directory.
+    """
+    from dataset_store import DatasetStore
+
+    store = DatasetStore()
+    files = sorted({path for pattern in step_for(name).outputs for path in glob.glob(pattern)} | set(outputs))
+    for file in files:
         try:
-            # Use the same Python interpreter to run the script
-            result = subprocess.run([sys.executable, script], check=True, capture_output=False, text=True)
-            print(f"Output of {script}:\n{result.stdout}")
-            if result.stderr:
-                print(f"Errors from {script}:\n{result.stderr}")
-        except subprocess.CalledProcessError as e:
-            print(f"Failed to execute {script}. Return code: {e.returncode}")
-            print(f"Error output: {e.stderr}")
+            entry = store.ingest(Path(file), step=name)
+        except Exception as e:
+            print(f"Could not archive {file}: {e}")
+            continue
+        if prune and entry is not None and file not in outputs:
+            os.remove(file)
+    print(f"Archived {name} outputs to {store.root}")
+
+def print_summary(results: List[Dict[str, Any]], elapsed: float) -> None:
+    print(f"\n{'Source':<24} {'Status':<8} {'RC':>4} {'Wall(s)':>9} {'CPU(s)':>9}  Log")
+    for result in sorted(results, key=lambda r: r["Source"]):
+        cpu = f'{result["CPU"]:.2f}' if result["CPU"] is not None else '-'
+        rc = result["ReturnCode"] if result["ReturnCode"] is not None else '-'
+        print(f'{result["Source"]:<24} {result["Status"]:<8} {rc:>4} {result["Wall"]:>9.2f} {cpu:>9}  {result["Log"]}')
+    serial = sum(result["Wall"] for result in results)
+    print(f"--- {len(results)} sources in {elapsed:.2f}s wall ({serial:.2f}s if run serially) ---")
+
+def skipped_result(name: str, status: str) -> Dict[str, Any]:
+    return {"Source": name, "Status": status, "ReturnCode": None, "Wall": 0.0, "CPU": None, "MaxRSS": None, "Log": "-"}
+
+def main(sources: Optional[List[str]] = None, jobs: int = DEFAULT_JOBS, timeout: Optional[float] = DEFAULT_TIMEOUT, force: bool = False, isolate: bool = False, profile: bool = False, prune: bool = False) -> int:
+    """
+    Runs the sources and the steps downstream of them in dependency order.
+    Unless force is set, a step whose inputs are unchanged since its last
+    successful run is skipped and its outputs reused (see run_plan.py).
+    Steps share this interpreter unless isolate is set, in which case each
+    runs in its own. With profile, every step that runs writes a per-stage
+    profile (see profiling.py); in one interpreter the steps then run one at
+    a time, since allocation tracing and cProfile are process-wide. With
+    prune, earlier outputs are deleted once archived (see archive_outputs).
+    """
+    names = sources if sources is not None else discover_sources()
+
+    if not names:
+        print("No source plugins found to execute.")
+        return 0
+
+    args: List[str] = [PROFILE_FLAG] if profile else []
+    if profile and not isolate and jobs > 1:
+        print("Profiling in one interpreter: running one step at a time (use --isolate to profile in parallel).")
+        jobs = 1
+
+    steps: List[str] = plan(names)
+    state = RunState()
+    remotes = remote_versions(steps)
+    results: List[Dict[str, Any]] = []
+    statuses: Dict[str, str] = {}
+    waiting: List[str] = list(steps)
+    running: Dict[Future, Tuple[str, Dict[str, Optional[str]], float]] = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(steps)))) as pool:
+        while waiting or running:
+            # Start (or skip) every step whose dependencies have finished
+            for name in list(waiting):
+                dependencies = [dependency for dependency in step_for(name).after if dependency in steps]
+                if any(dependency not in statuses for dependency in dependencies):
+                    continue
+                waiting.remove(name)
+                failed = [dependency for dependency in dependencies if statuses[dependency] not in OK_STATUSES]
+                if failed:
+                    print(f"Skipping {name}: {', '.join(failed)} did not finish")
+                    statuses[name] = "blocked"
+                    results.append(skipped_result(name, "blocked"))
+                    continue
+                script = script_for(name)
+                fingerprint = state.fingerprint(name, script, remotes.get(name))
+                reason = None if force else state.reusable(name, fingerprint)
+                if reason:
+                    print(f"Reusing {name} ({reason}): {', '.join(state.outputs(name)) or 'no outputs'}")
+                    statuses[name] = "reused"
+                    results.append(skipped_result(name, "reused"))
+                    continue
+                print(f"Executing {name}{' in its own interpreter' if isolate else ''}...")
+                future = pool.submit(run_source, script, timeout, args=args) if isolate else pool.submit(run_in_process, name, timeout, args=args)
+                running[future] = (name, fingerprint, time.time())
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, fingerprint, started = running.pop(future)
+                result = future.result()
+                results.append(result)
+                statuses[name] = result["Status"]
+                print(f'Finished {name}: {result["Status"]} in {result["Wall"]:.2f}s')
+                if result["Status"] == "ok":
+                    outputs = state.record(name, fingerprint, started)
+                    if ARCHIVE:
+                        archive_outputs(name, outputs, prune)
+                else:
+                    print(f'Failed to execute {name}. See {result["Log"]}')
+    print_summary(results, time.perf_counter() - start)
+    if profile:
+        print(f"--- Profiles saved to {PROFILE_DIR} (see each step's log for its files) ---")
+    return 0 if all(result["Status"] in OK_STATUSES for result in results) else 1
 
 def delete_files(patterns=('*.csv', '*.zip')):
     cwd = Path('.')
@@ -40,8 +236,30 @@ def delete_files(patterns=('*.csv', '*.zip')):
         print("No .csv or .zip files found to delete.")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the source plugins concurrently, then the steps downstream of them; unchanged steps are skipped.")
+    parser.add_argument("sources", nargs="*", help="Only run these sources or stages (e.g. parse_nws_alerts, join_counties)")
+    parser.add_argument("-d", "--delete", action="store_true", help="Delete .csv and .zip outputs before running")
+    parser.add_argument("-i", "--isolate", action="store_true", help="Run each step in its own interpreter (enforces --timeout, costs one interpreter startup per step)")
+    parser.add_argument("-f", "--force", action="store_true", help="Run every step even if its inputs are unchanged")
+    parser.add_argument(PROFILE_FLAG, action="store_true", help=f"Profile every step per stage into {PROFILE_DIR}/ (implies --force)")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS, help=f"Number of sources to run at once (default: {DEFAULT_JOBS})")
+    parser.add_argument("--prune-outputs", action="store_true", help="Delete each step's earlier outputs from the working directory once they are archived")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the HTTP response cache")
+    parser.add_argument("--refresh", action="store_true", help="Refetch every response and overwrite the HTTP response cache")
+    parser.add_argument("-t", "--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"Per-source timeout in seconds, 0 for none (default: {DEFAULT_TIMEOUT:.0f})")
+    args = parser.parse_args()
+    try:
+        sources = discover_sources(args.sources)
+    except ValueError as e:
+        parser.error(str(e))
 
-    if sys.argv[1] in ["--delete", "-d", "/?"]:
+    if args.delete:
         delete_files()
 
-    main()
+    # Sources inherit the cache mode through the environment (see http_cache.py)
+    if args.no_cache:
+        os.environ['HTTP_CACHE'] = 'off'
+    elif args.refresh:
+        os.environ['HTTP_CACHE'] = 'refresh'
+
+    sys.exit(main(sources, jobs=args.jobs, timeout=args.timeout or None, force=args.force or args.profile, isolate=args.isolate, profile=args.profile, prune=args.prune_outputs))
@@ -0,0 +1,90 @@
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from join_counties import latest_output, read_table
+from profiling import PROFILE_FLAG, run_profiled, stage
+from spatial_index import PointGrid
+
+# Match active NWS alert polygons to RIDB campsites by facility location.
+# Usage: python match_alerts.py [alert_areas.jsonl] [ridb_output] [--all] [--profile]
+
+# Set Globals
+DATA_SOURCE: str = 'ALERT_CAMPSITES'                                    # Name of data source
+TIMESTAMP: str = f'{datetime.now():%Y%m%dT%H%M%S}'                      # Current timestamp
+OUTPUT_CSV: str = f'{DATA_SOURCE}_{TIMESTAMP}.csv'                      # Output filename
+AREAS_PATTERN: str = 'NWS_ALERT_AREAS_*.jsonl'                          # parse_nws_alerts.py alert polygons
+RIDB_PATTERN: str = 'REC_RIDB_*.*'                                      # parse_rec_ridb.py outputs (any OUTPUT_FORMAT)
+CAMPSITE_COLUMNS: List[str] = ["CampsiteID", "CampsiteName", "FacilityID", "FacilityName", "FacilityLatitude", "FacilityLongitude", "OrgName"]
+ALERT_COLUMNS: List[str] = ["AlertId", "Event", "Headline", "Severity", "Onset", "Expires"]
+
+
+def load_alerts(path: str, active_only: bool = True, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    # Alert polygons, without those that have already expired
+    now = now or datetime.now(timezone.utc)
+    alerts: List[Dict[str, Any]] = []
+    with open(path) as f:
+        for line in f:
+            alert = json.loads(line)
+            expires = alert.get("Expires")
+            if active_only and expires and datetime.fromisoformat(expires) <= now:
+                continue
+            alerts.append(alert)
+    return alerts
+
+def match_alerts(campsites: pd.DataFrame, alerts: List[Dict[str, Any]], grid: Optional[PointGrid] = None) -> pd.DataFrame:
+    """
+    Returns one row per (campsite, alert) where the campsite's facility lies
+    inside the alert polygon. Pass a prebuilt grid to reuse it across refreshes.
+    """
+    grid = grid or PointGrid(
+        pd.to_numeric(campsites["FacilityLongitude"], errors="coerce"),
+        pd.to_numeric(campsites["FacilityLatitude"], errors="coerce"),
+    )
+    rows: List[np.ndarray] = []
+    alert_rows: List[int] = []
+    for i, alert in enumerate(alerts):
+        hits = grid.query(alert["Geometry"])
+        rows.append(hits)
+        alert_rows.extend([i] * len(hits))
+    if not alert_rows:
+        return pd.DataFrame(columns=ALERT_COLUMNS + CAMPSITE_COLUMNS)
+    matched = campsites.iloc[np.concatenate(rows)].reset_index(drop=True)
+    alert_frame = pd.DataFrame(alerts, columns=ALERT_COLUMNS).iloc[alert_rows].reset_index(drop=True)
+    columns = [column for column in CAMPSITE_COLUMNS if column in matched.columns]
+    return pd.concat([alert_frame, matched[columns]], axis=1)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if PROFILE_FLAG in argv:
+        return run_profiled(DATA_SOURCE, main, [arg for arg in argv if arg != PROFILE_FLAG])
+    args = [arg for arg in argv if not arg.startswith("-")]
+    if any(arg in ["--help", "-h", "/?"] for arg in argv):
+        print(f"Usage: {os.path.basename(__file__)} [alert_areas.jsonl] [ridb_output] [--all] [{PROFILE_FLAG}]")
+        return 0
+    areas_file = args[0] if len(args) > 0 else latest_output(AREAS_PATTERN)
+    ridb_file = args[1] if len(args) > 1 else latest_output(RIDB_PATTERN)
+    if not areas_file or not ridb_file:
+        print(f"Nothing to match: need {AREAS_PATTERN} and {RIDB_PATTERN} outputs.")
+        return 0
+
+    with stage("fetch"):
+        alerts = load_alerts(areas_file, active_only="--all" not in argv)
+        campsites = read_table(ridb_file)
+    print(f"Matching {len(alerts)} alert polygons from {areas_file} against {len(campsites)} campsites from {ridb_file} =>")
+    with stage("filter"):
+        matches = match_alerts(campsites, alerts)
+    with stage("write"):
+        matches.to_csv(OUTPUT_CSV, index=False)
+    print(f"--- {DATA_SOURCE} data matched: {len(matches)} campsites under {matches['AlertId'].nunique()} alerts ---")
+    print(f"--- Saved to {OUTPUT_CSV} ---")
+    return 0
+
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,18 @@
 import os
+import re
 import sys
+import threading
 import zipfile
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from download import download
+from http_client import create_session
+from profiling import PROFILE_FLAG, run_profiled, stage
 
 # Set Globals
 DATA_SOURCE: str = 'FEMA_NRI'                                           # Name of data source. eg. "USDA_NASS"
@@ -17,27 +22,21 @@ OUTPUT_CSV: str = f'{DATA_SOURCE}_{TIMESTAMP}.csv'                      # Output
 records: List[Dict] = []                                                # List to hold records
 # df: Optional[pd.DataFrame] = None
 
-# Define the retry strategy
-retries = Retry(
-    total=10,                                                           # Maximum 10 retries
-    backoff_factor=3,                                                   # Exponential backoff (1s, 2s, 4s, etc.)
-    status_forcelist=[502, 503, 504, 429, 403],                         # Retry on these HTTP status codes
-    allowed_methods=["GET"],                                            # Apply retry only to GET requests
-    backoff_max=60                                                      # Maximum backoff time of 60 seconds
-)
+# Create a pooled session with the shared retry policy and timeouts
+session: requests.Session = create_session(DATA_SOURCE)
 
-# Create a session and mount the adapter
-session: requests.Session = requests.Session()
-session.mount("https://", HTTPAdapter(max_retries=retries))
-# session.headers.update(HEADERS)
+# Compact dtypes for the columnar cache: ratings are a handful of labels, scores fit in float32
+ZIP_FILENAME: str = 'NRI_Table_Counties.zip'
+CSV_FILE: str = 'NRI_Table_Counties.csv'                                # County table inside the zip
+ZIP_URL: str = f'https://hazards.fema.gov/nri/Content/StaticDocuments/DataDownload//NRI_Table_Counties/{ZIP_FILENAME}'
+CACHE_FILE: str = 'NRI_Table_Counties.parquet'
+CATEGORY_COLUMNS = re.compile(r'^(STATE|STATEABBRV)$|(RATNG|_RISKR|_EALR)$')
+FLOAT32_COLUMNS = re.compile(r'(SCORE|_RISKS|_EALS|_SPCTL)$')
+HIGH_RISK: List[str] = ["Very High", "Relatively High"]                # Ratings kept for overall and per-hazard risk
+HAZARD_SET: str = os.environ.get('NRI_HAZARDS', 'primary')              # "primary" or "all" (primary + secondary)
+TOP_K: Optional[int] = int(os.environ['NRI_TOP_K']) if os.environ.get('NRI_TOP_K') else None   # Keep only the K riskiest counties per hazard
 
 # Define prototypes
-EXTRACT_FILES = {
-    "NRI_Table_Counties.csv",
-    "NRI_HazardInfo.csv",
-    "NRIDataDictionary.csv"
-}
-
 primary_disasters: List[str] = [
     "CFLD",
     "ERQK",
@@ -48,21 +47,21 @@ primary_disasters: List[str] = [
     "WFIR",
     ]
 
-# secondary_disasters = [
-    # 'CWAV',
-    # 'DRGT',
-    # 'HWAV',
-    # 'ISTM',
-    # 'SWND',
-    # 'TSUN',
-    # 'VLCN',
-    # 'WNTW'
-# ]
+secondary_disasters: List[str] = [
+    "CWAV",
+    "DRGT",
+    "HWAV",
+    "ISTM",
+    "SWND",
+    "TSUN",
+    "VLCN",
+    "WNTW",
+    ]
 
-# disasters = primary_disasters + secondary_disasters
+disasters: List[str] = primary_disasters + secondary_disasters
 
 # List of columns we want to extract
-def get_selected_columns() -> List[str]:
+def get_selected_columns(hazards: List[str] = primary_disasters) -> List[str]:
     selected_columns = [
         "STATE",
         "STATEABBRV",
@@ -81,11 +80,76 @@ def get_selected_columns() -> List[str]:
     ## _RISKV = Hazard Type Risk Index Value
     ## _RISKS = Hazard Type Risk Index Score
     ## _RISKR = Hazard Type Risk Index Rating
-    for disaster in primary_disasters:
+    for disaster in hazards:
         selected_columns += [f"{disaster}_RISKV", f"{disaster}_RISKS", f"{disaster}_RISKR"]
 
     return selected_columns
 
+# Integrity check for a downloaded archive: readable zip whose members all pass their CRC
+def valid_zip(path: str) -> bool:
+    try:
+        with zipfile.ZipFile(path) as z:
+            return z.testzip() is None
+    except zipfile.BadZipFile:
+        return False
+
+# Open a CSV member of the NRI archive by file name, wherever it sits inside the zip
+def open_member(z: zipfile.ZipFile, filename: str):
+    for member in z.namelist():
+        if os.path.basename(member) == filename:
+            return z.open(member)
+    raise FileNotFoundError(f"{filename} not found in {z.filename}")
+
+def compact_dtypes(columns: List[str]) -> Dict[str, str]:
+    dtypes: Dict[str, str] = {}
+    for column in columns:
+        if CATEGORY_COLUMNS.search(column):
+            dtypes[column] = "category"
+        elif FLOAT32_COLUMNS.search(column):
+            dtypes[column] = "float32"
+    return dtypes
+
+def load_nri(zip_filename: str, csv_file: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Loads the NRI county table, reading only the requested columns.
+    The CSV is streamed straight out of the zip on the first run and saved as a
+    Parquet cache with compact dtypes; later runs read the cache while it is
+    newer than the zip.
+    """
+    if os.path.exists(CACHE_FILE) and os.path.getmtime(CACHE_FILE) >= os.path.getmtime(zip_filename):
+        try:
+            print(f"Loading {DATA_SOURCE} data from {CACHE_FILE}...")
+            return pd.read_parquet(CACHE_FILE, columns=columns)
+        except ImportError as e:
+            print(f"Cannot read {CACHE_FILE} ({e}); parsing {zip_filename} instead.")
+        except Exception as e:
+            # A corrupt cache is rebuilt from the zip instead of failing every later run
+            print(f"Cannot read {CACHE_FILE} ({e!r}); deleting it and parsing {zip_filename} instead.")
+            try:
+                os.remove(CACHE_FILE)
+            except OSError:
+                pass
+
+    print(f"Reading {DATA_SOURCE} data from {zip_filename}:{csv_file}...")
+    with zipfile.ZipFile(zip_filename, "r") as z:
+        with open_member(z, csv_file) as f:
+            header: List[str] = pd.read_csv(f, nrows=0).columns.tolist()
+        with open_member(z, csv_file) as f:
+            df: pd.DataFrame = pd.read_csv(f, dtype=compact_dtypes(header), low_memory=False)
+
+    # Written under a private name and moved into place, so readers never see a partial file
+    partial = f"{CACHE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        df.to_parquet(partial, index=False)
+        os.replace(partial, CACHE_FILE)
+        print(f"--- Cached to {CACHE_FILE} ---")
+    except (ImportError, OSError) as e:
+        print(f"Skipping {CACHE_FILE} cache: {e}")
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return df[columns] if columns is not None else df
+
 # Function to parse FEMA National Risk Index CSV
 def parse_dictionary() -> pd.Series:
     # Load the CSV file into a DataFrame
@@ -93,8 +157,9 @@ def parse_dictionary() -> pd.Series:
     # https://hazards.fema.gov/nri/Content/StaticDocuments/DataDownload//NRI_Table_Counties/NRI_Table_Counties.zip
     # Load the CSV file into a DataFrame
     
-    dictionary_file = "NRI_HazardInfo.csv"  # Path to the dictionary CSV file
-    dictionary_df: pd.DataFrame = pd.read_csv(dictionary_file)
+    dictionary_file = "NRI_HazardInfo.csv"  # Dictionary CSV inside the archive
+    with zipfile.ZipFile(ZIP_FILENAME, "r") as z, open_member(z, dictionary_file) as f:
+        dictionary_df: pd.DataFrame = pd.read_csv(f)
 
     # Extract relevant columns (customize based on your need)
     dictionary_columns: List[str] = [
@@ -116,84 +181,86 @@ def parse_dictionary() -> pd.Series:
     # print(df.columns.tolist())
     return filtered_dictionary
 
+def rank_hazards(df: pd.DataFrame, hazards: List[str], top_k: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Returns {hazard: counties rated HIGH_RISK for that hazard, sorted by RISK_SCORE}.
+    Place names and every hazard mask are computed once over the base frame, which
+    is never copied; each result only materializes its own rows. With top_k, the
+    riskiest counties are picked by partial selection instead of a full sort.
+    """
+    place_names: np.ndarray = (df["COUNTY"] + " County, " + df["STATEABBRV"].astype(str)).to_numpy()
+    masks: np.ndarray = df[[f"{hazard}_RISKR" for hazard in hazards]].isin(HIGH_RISK).to_numpy()
+    # Negate so ascending order ranks the highest score first (NaN scores sort last)
+    scores: np.ndarray = -df["RISK_SCORE"].to_numpy(dtype="float64")
+    order: Optional[np.ndarray] = np.argsort(scores, kind="stable") if top_k is None else None
+
+    ranked: Dict[str, pd.DataFrame] = {}
+    for i, hazard in enumerate(hazards):
+        if order is not None:
+            rows = order[masks[order, i]]
+        else:
+            rows = np.flatnonzero(masks[:, i])
+            if len(rows) > top_k:
+                rows = rows[np.argpartition(scores[rows], top_k - 1)[:top_k]]
+            rows = rows[np.argsort(scores[rows], kind="stable")]
+        ranked[hazard] = df.iloc[rows].assign(**{"Place names": place_names[rows]})
+    return ranked
+
 # Function to parse FEMA National Risk Index CSV
-def parse_fema_nri(disaster: str, df: pd.Series) -> pd.DataFrame:
-    # Display basic info about columns (for reference)
-    # print("Columns in CSV:")
-    # print(df.columns.tolist())
+def parse_fema_nri(disaster: str, df: pd.DataFrame) -> pd.DataFrame:
+    # Counties where the specific risk is either 'Very High' or 'Relatively High', sorted by Overall Risk Score
+    return rank_hazards(df, [disaster])[disaster]
 
-    # Format specific columns
-    # disaster_df.style.format({"POPULATION": "{:,d}"})
-    # disaster_df.style.format({'RISK_VALUE': '${:,.2f}'})
-    disaster_df = df.copy()
-    # Add custom column concatenating COUNTY and STATE abbreviation
-    # disaster_df["Place names"] = f'{disaster_df["COUNTY"]} County, {disaster_df["STATEABBRV"]}'
-    disaster_df["Place names"] = (
-        disaster_df["COUNTY"] + " County, " + disaster_df["STATEABBRV"]
-    )
-    # Filter the DataFrame where the specific risk is either 'Very High' or 'Relatively High'
-    filtered_disaster_df = disaster_df[
-        disaster_df[f"{disaster}_RISKR"].isin(["Very High", "Relatively High"])
-    ]
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if PROFILE_FLAG in argv:
+        return run_profiled(DATA_SOURCE, main, [arg for arg in argv if arg != PROFILE_FLAG])
+    if argv and argv[0] in ["--help", "-h", "/?"]:
+        print(f"Usage: {os.path.basename(__file__)} [path_to_csv] [{PROFILE_FLAG}]")
+        return 0
+    if argv:
+        print(f"Usage: {os.path.basename(__file__)} [path_to_csv] [{PROFILE_FLAG}]")
+        return 1
+
+    # 1. Download the zip, or check the local copy against FEMA's latest release
+    print(f"Fetching {DATA_SOURCE} data from {ZIP_URL} =>")
+    try:
+        with stage("fetch"):
+            downloaded = download(ZIP_URL, ZIP_FILENAME, session, validate=valid_zip)
+        if downloaded:
+            print("Download complete.")
+        else:
+            print(f"{ZIP_FILENAME} is up to date. Skipping download.")
+    except (requests.exceptions.RequestException, IOError) as e:
+        if not os.path.exists(ZIP_FILENAME):
+            raise
+        print(f"Could not refresh {ZIP_FILENAME} ({e}); using the local copy.")
+
+    # 2. Read the selected columns straight from the zip (or its columnar cache)
+    hazards: List[str] = disasters if HAZARD_SET == "all" else primary_disasters
+    with stage("normalize"):
+        df = load_nri(ZIP_FILENAME, CSV_FILE, get_selected_columns(hazards))
 
-    # Sort by Overall Risk Score
-    sorted_df = filtered_disaster_df.sort_values(by="RISK_SCORE", ascending=False)
 
-    # Return the sorted DataFrame
-    return sorted_df
+    # Filter the DataFrame where the overall risk is either 'Very High' or 'Relatively High'
+    if df is None:
+        print("There was an error loading the CSV file.")
+        return 1
+    with stage("filter"):
+        filtered_df: pd.DataFrame = df[df["RISK_RATNG"].isin(HIGH_RISK)]
+        # Rank every hazard in one pass over the filtered frame
+        ranked = rank_hazards(filtered_df, hazards, TOP_K)
+    for disater, parsed_data in ranked.items():
+        # parsed_data = parse_dictionary()
+
+        # Save parsed data to new CSV file
+        output_csv = f'{DATA_SOURCE}_{disater}_{TIMESTAMP}.csv'
+        with stage("write"):
+            parsed_data.to_csv(output_csv.upper(), index=False)
+        # parsed_data.to_csv(sys.stdout, index=False)
+        print(f"--- Saved to {output_csv.upper()} ---")
+    return 0
 
 # Main execution
 if __name__ == "__main__":
-    if len(sys.argv) == 1:
-        ZIP_FILENAME='NRI_Table_Counties.zip'
-        CSV_FILE='NRI_Table_Counties.csv' # CSV file path passed as command-line argument
-        # 1. Check if the zip already exists locally
-        if not os.path.exists(ZIP_FILENAME):
-            # print(f"Downloading {ZIP_FILENAME}...")
-            print(f"Fetching {DATA_SOURCE} data from {API_BASE_URL} =>")
-            resp = requests.get(f'https://hazards.fema.gov/nri/Content/StaticDocuments/DataDownload//NRI_Table_Counties/{ZIP_FILENAME}', stream=True)
-            resp.raise_for_status()
-            with open(ZIP_FILENAME, "wb") as f:
-                for chunk in resp.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            print("Download complete.")
-        else:
-            print(f"{ZIP_FILENAME} already exists. Skipping download.")
-
-        # 2. Extract only the desired CSV files
-        if not os.path.exists(CSV_FILE):
-            with zipfile.ZipFile(ZIP_FILENAME, "r") as z:
-                for member in z.namelist():
-                    filename = os.path.basename(member)
-                    if filename in EXTRACT_FILES:
-                        print(f"Extracting {filename}...")
-                        z.extract(member, ".")
-            print("Extraction complete.")
-            print(f"Fetching {DATA_SOURCE} data from {CSV_FILE}...")
-        else:
-            print(f"{CSV_FILE} already exists. Skipping extraction.")
-        df = pd.read_csv(CSV_FILE, usecols=get_selected_columns(), low_memory=False)
-
-
-        # Filter the DataFrame where the overall risk is either 'Very High' or 'Relatively High'
-        if df is not None:
-            filtered_df: pd.Series = df[df["RISK_RATNG"].isin(["Very High", "Relatively High"])]
-            for disater in primary_disasters:
-                # Parse the CSV
-                parsed_data = parse_fema_nri(disater, filtered_df)
-                # parsed_data = parse_dictionary()
-
-                # Save parsed data to new CSV file
-                OUTPUT_CSV = f'{DATA_SOURCE}_{disater}_{TIMESTAMP}.csv'
-                parsed_data.to_csv(OUTPUT_CSV.upper(), index=False)
-                # parsed_data.to_csv(sys.stdout, index=False)
-                print(f"--- Saved to {OUTPUT_CSV.upper()} ---")
-        else:
-            print("There was an error loading the CSV file.")
-            sys.exit(1)
-    elif sys.argv[1] in ["--help", "-h", "/?"]:
-        print(f"Usage: {sys.argv[0]} [path_to_csv]")
-        sys.exit(0)
-    else:
-        print(f"Usage: {sys.argv[0]} [path_to_csv]")
-        sys.exit(1)
\ No newline at end of file
+    sys.exit(main())
@@ -1,36 +1,36 @@
+import hashlib
+import json
+import os
+import re
 import sys
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Set
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
 
 import pandas as pd
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from async_fetch import AsyncFetcher, iterate, paginate_links
+from county_index import AlertAreas, county_names, load_alert_areas
+from http_client import create_session
+from profiling import PROFILE_FLAG, run_profiled, stage, staged
+from record_sinks import open_sink, output_path
 
 # Fetch alerts from the National Weather Service API with specific filters.
 # Usage: python fetch_weather_alerts.py [output_file.csv]
+#        python parse_nws_alerts.py --watch [polls]     (poll until interrupted, writing only changes)
+#        add --profile to either for a per-stage profile (see profiling.py)
 
 # Set Globals
 DATA_SOURCE: str = 'NWS_ALERTS'                              # Name of data source. eg. "NASS_USDA"
 TIMESTAMP: str = f'{datetime.now():%Y%m%dT%H%M%S}'           # Current timestamp
 API_BASE_URL: str = 'https://api.weather.gov/alerts'         # API URL endpoint
-OUTPUT_FILENAME: str = f'{DATA_SOURCE}_{TIMESTAMP}.csv'      # Output filename
-records: List[Dict] = []                                     # List to hold records
-
-# Define the retry strategy
-retries = Retry(
-    total=10,                                       # Maximum 5 retries
-    backoff_factor=3,                               # Exponential backoff (1s, 2s, 4s, etc.)
-    status_forcelist=[502, 503, 504, 429, 403],     # Retry on these HTTP status codes
-    allowed_methods=["GET"],                        # Apply retry only to GET requests
-    backoff_max=60                                  # Maximum backoff time of 60 seconds
-)
-
-# Create a session and mount the adapter
-session: requests.Session = requests.Session()
-session.mount("https://", HTTPAdapter(max_retries=retries))
-# session.headers.update(HEADERS)
-
+OUTPUT_FILENAME: str = output_path(f'{DATA_SOURCE}_{TIMESTAMP}')  # Output filename (extension follows OUTPUT_FORMAT)
+AREAS_FILENAME: str = output_path(f'NWS_ALERT_AREAS_{TIMESTAMP}', 'jsonl')  # Alert polygons for match_alerts.py
+CHANGES_FILENAME: str = output_path(f'NWS_ALERT_CHANGES_{TIMESTAMP}', 'jsonl')  # Watch mode: new, updated and expired alerts
+WATCH_MIN_INTERVAL: float = float(os.environ.get('NWS_WATCH_MIN_INTERVAL', 30))   # Seconds between polls while alerts keep changing
+WATCH_MAX_INTERVAL: float = float(os.environ.get('NWS_WATCH_MAX_INTERVAL', 300))  # Seconds between polls once nothing changes
+MAX_AGE = re.compile(r"max-age=(\d+)")
 
 # Default filter parameters
 PARAMS = {
@@ -50,6 +50,48 @@ HEADERS = {
     "Accept": "application/geo+json"
 }
 
+# Create a pooled session with the shared retry policy and timeouts
+session: requests.Session = create_session(DATA_SOURCE, headers=HEADERS)
+
+
+# Columns written for every (alert, county) record
+RECORD_FIELDS: List[str] = ["Place Names", "FIPS", "AlertId", "Headline", "SenderName", "Event", "Severity", "Urgency", "Certainty"]
+ALERT_FIELDS: Dict[str, str] = {
+    "AlertId": "id",
+    "Headline": "headline",
+    "SenderName": "senderName",
+    "Event": "event",
+    "Severity": "severity",
+    "Urgency": "urgency",
+    "Certainty": "certainty",
+}
+
+
+async def crawl_pages(url: str, params: Optional[Dict[str, str]]) -> AsyncIterator[List[Dict[str, Any]]]:
+    async with AsyncFetcher(DATA_SOURCE, headers=HEADERS) as fetcher:
+        async for page in paginate_links(fetcher, url, params):
+            yield page
+
+def iter_pages(first: Optional[requests.Response] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yields the weather alert features matching the filter parameters, one page
+    at a time, starting from `first` when the first page is already fetched.
+    Pages are crawled on the async fetch engine (see async_fetch.py), which
+    requests the next page (from the Link header) while the current page is
+    decoded and consumed.
+    """
+    if first is None:
+        yield from iterate(crawl_pages(API_BASE_URL, PARAMS.copy()))
+        return
+    yield first.json().get("features", [])
+    # After first request, parameters should not be resent
+    next_url: Optional[str] = first.links.get("next", {}).get("url")
+    if next_url:
+        yield from iterate(crawl_pages(next_url, None))
+
+def iter_alerts() -> Iterator[Dict[str, Any]]:
+    for page in iter_pages():
+        yield from page
 
 def fetch_all_alerts():
     """
@@ -57,96 +99,255 @@ def fetch_all_alerts():
     following pagination links until completion.
     Returns a list of alert feature dicts.
     """
-    alerts: List = []
-    url: Optional[str] = API_BASE_URL
-    params: Optional[Dict[str,str]] = PARAMS.copy()
+    return list(iter_alerts())
 
-    while url:
-        response = requests.get(url, headers=HEADERS, params=params)
-        response.raise_for_status()
-        data = response.json()
-        features = data.get("features", [])
-        alerts.extend(features)
-
-        # Determine next page URL from Link header
-        link_header = response.headers.get("Link")
-        next_url = None
-        if link_header:
-            # Parse link header, find rel="next"
-            parts = link_header.split(',')
-            for part in parts:
-                section = part.split(';')
-                if len(section) < 2:
-                    continue
-                url_part = section[0].strip()[1:-1]
-                rel_part = section[1].strip()
-                if 'rel="next"' in rel_part:
-                    next_url = url_part
-                    break
-
-        url = next_url
-        # After first request, parameters should not be resent
-        params = None
-    return alerts
-
-def main():
+def alert_codes(properties: Dict[str, Any]) -> List[str]:
+    # SAME codes name counties directly; UGC codes are the fallback (zones need the correlation table)
+    geocode = properties.get("geocode") or {}
+    return geocode.get("SAME") or geocode.get("UGC") or []
+
+def pair_area_names(codes: List[str], area_desc: str) -> List[Tuple[str, str]]:
+    # (code, area name): areaDesc lists one name per code, in code order, when the counts agree; otherwise the whole areaDesc
+    names = [name.strip() for name in area_desc.split(";")]
+    if len(names) != len(codes):
+        names = [area_desc] * len(codes)
+    return list(zip(codes, names))
+
+def expand_alerts(alerts: List[Dict[str, Any]], areas: AlertAreas, names: Dict[str, str]) -> pd.DataFrame:
+    """
+    One row per (alert id, county) for a page of alerts. Codes are exploded and
+    resolved to counties in bulk; overlapping codes within an alert collapse to
+    one row, while different alerts for the same county each keep theirs.
+    Alerts whose codes resolve to no county fall back to their areaDesc names.
+    Counties missing from names (no NRI table yet) are named from areaDesc.
+    """
+    properties = [alert.get("properties", {}) for alert in alerts]
+    frame = pd.DataFrame({field: [p.get(key) for p in properties] for field, key in ALERT_FIELDS.items()})
+    frame["Areas"] = [p.get("areaDesc") or "" for p in properties]
+    frame["Codes"] = [pair_area_names(alert_codes(p), areas_desc) for p, areas_desc in zip(properties, frame["Areas"])]
+
+    counties = frame.explode("Codes", ignore_index=True).dropna(subset=["Codes"])
+    counties["Area"] = counties["Codes"].str[1]
+    counties["Codes"] = counties["Codes"].str[0]
+    counties["FIPS"] = areas.fips_series(counties["Codes"])
+    counties = counties.explode("FIPS", ignore_index=True).dropna(subset=["FIPS"])
+    counties = counties.drop_duplicates(["AlertId", "FIPS"])
+    counties["Place Names"] = counties["FIPS"].map(names).fillna(counties["Area"])
+
+    unresolved = frame[~frame["AlertId"].isin(counties["AlertId"])]
+    places = unresolved.assign(**{"Place Names": unresolved["Areas"].str.split(";")}).explode("Place Names", ignore_index=True)
+    places["Place Names"] = places["Place Names"].str.strip()
+    places = places[places["Place Names"] != ""].drop_duplicates(["AlertId", "Place Names"]).assign(FIPS=None)
+
+    expanded = pd.concat([counties[RECORD_FIELDS], places[RECORD_FIELDS]], ignore_index=True)
+    return expanded.astype(object).where(expanded.notna(), None)
+
+def build_area(alert: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # The alert's polygon, for alerts drawn as one (zone-based alerts have none)
+    if not alert.get("geometry"):
+        return None
+    properties = alert.get("properties", {})
+    return {
+        "AlertId": properties.get('id'),
+        "Event": properties.get('event'),
+        "Headline": properties.get('headline'),
+        "Severity": properties.get('severity'),
+        "Onset": properties.get('onset'),
+        "Expires": properties.get('ends') or properties.get('expires'),
+        "Geometry": alert["geometry"],
+    }
+
+def write_alerts() -> int:
     # Optionally write output to file
-    OUTPUT_CSV = f'{DATA_SOURCE}_{TIMESTAMP}.csv'
-    alert_areas: Set[Any] = set()
-    all_alerts: List = []
+    areas: AlertAreas = load_alert_areas()
+    names: Dict[str, str] = county_names()
+    seen: Set[Any] = set()
+    fetched: int = 0
 
     try:
-        alerts = fetch_all_alerts()
-        print(f"Fetched {len(alerts)} alerts.")
-        for alert in alerts:
-            properties = alert.get("properties", {})
-            if properties.get('areaDesc') not in alert_areas:
-                alert_areas.add(properties.get('areaDesc'))
-                for location in properties.get('areaDesc').split(';'):
-                    # Create records
-                    record = {
-                        "Place Names": location.strip(),
-                        "Headline": properties.get('headline'),
-                        "SenderName": properties.get('senderName'),
-                        "Event": properties.get('event'),
-                        "Severity": properties.get('severity'),
-                        "Urgency": properties.get('urgency'),
-                        "Certainty": properties.get('certainty'),
-                    }
-                    all_alerts.append(record)
-
-        # json.dump(alerts, f, indent=2)
-        df = pd.json_normalize(all_alerts)
-        df.to_csv(OUTPUT_CSV, index=False)
-        print(f"--- Parsed data saved to {OUTPUT_CSV}---")
-        # Print JSON to stdout
-        for alert in all_alerts:
-            print(f"- \
-{alert['Place Names']} | \
-{alert['Event']} | \
-{alert['Headline']} | \
-{alert['Severity']} | \
-{alert['Urgency']} | \
-{alert['Certainty']}"
-)
-        print(f"{len(alert_areas)} unique alerts.")
+        # Records are written in batches as pages arrive instead of after the whole crawl
+        with open_sink(f'{DATA_SOURCE}_{TIMESTAMP}', fields=RECORD_FIELDS) as sink, \
+                open_sink(f'NWS_ALERT_AREAS_{TIMESTAMP}', 'jsonl') as polygons:
+            for page in staged("fetch", iter_pages()):
+                fetched += len(page)
+                with stage("filter"):
+                    # An alert repeated on a later page is only expanded once
+                    alerts = [alert for alert in page if alert.get("properties", {}).get("id") not in seen]
+                    seen.update(alert.get("properties", {}).get("id") for alert in alerts)
+                with stage("normalize"):
+                    shapes = [area for area in map(build_area, alerts) if area is not None]
+                    records = expand_alerts(alerts, areas, names) if alerts else pd.DataFrame(columns=RECORD_FIELDS)
+                with stage("write"):
+                    polygons.write_many(shapes)
+                    sink.write_many(records.to_dict("records"))
+                for event, count in records["Event"].value_counts().items():
+                    print(f"- {event} | {count} counties")
+        print(f"Fetched {fetched} alerts.")
+        print(f"--- Parsed data saved to {OUTPUT_FILENAME}---")
+        print(f"{len(seen)} unique alerts, {sink.count} alert-county records.")
+        if polygons.count > 0:
+            print(f"--- {polygons.count} alert polygons saved to {AREAS_FILENAME} ---")
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching alerts: {e}", file=sys.stderr)
-        sys.exit(1)
+        return 1
+    return 0
 
-# Main execution
-if __name__ == "__main__":
-    if len(sys.argv) == 1:
+def alert_expiry(properties: Dict[str, Any]) -> Optional[datetime]:
+    expires = properties.get("ends") or properties.get("expires")
+    try:
+        return datetime.fromisoformat(expires) if expires else None
+    except ValueError:
+        return None
+
+class AlertIndex:
+    """
+    Active alerts keyed by alert id, with a digest of each one's properties.
+    update() takes the alerts from a poll and returns what changed since the
+    last one: ("new" | "updated" | "expired", alert).
+    """
+
+    def __init__(self):
+        self.alerts: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+    def update(self, alerts: List[Dict[str, Any]], now: Optional[datetime] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        now = now or datetime.now(timezone.utc)
+        current: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        changes: List[Tuple[str, Dict[str, Any]]] = []
+        for alert in alerts:
+            properties = alert.get("properties", {})
+            alert_id = properties.get("id")
+            expiry = alert_expiry(properties)
+            if alert_id is None or alert_id in current or (expiry is not None and expiry <= now):
+                continue
+            digest = hashlib.sha1(json.dumps(properties, sort_keys=True).encode()).hexdigest()
+            current[alert_id] = (digest, alert)
+            previous = self.alerts.get(alert_id)
+            if previous is None:
+                changes.append(("new", alert))
+            elif previous[0] != digest:
+                changes.append(("updated", alert))
+        # Alerts that dropped out of the feed (or ran past their end time) have expired
+        changes.extend(("expired", alert) for alert_id, (_, alert) in self.alerts.items() if alert_id not in current)
+        self.alerts = current
+        return changes
+
+    def expire(self, now: Optional[datetime] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        # Alerts that ran past their end time between polls, without refetching
+        return self.update([alert for _, alert in self.alerts.values()], now)
+
+class AlertPoller:
+    """
+    Polls the first alert page with the validators (ETag, Last-Modified) of the
+    last response, so an unchanged feed costs one 304 and no pages. Remembers
+    the server's Cache-Control max-age as a floor for the polling interval.
+    """
+
+    def __init__(self):
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.max_age: float = 0
+
+    def poll(self) -> Optional[List[Dict[str, Any]]]:
+        # Every alert in the feed, or None when it has not changed
+        headers: Dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        response = session.get(API_BASE_URL, params=PARAMS.copy(), headers=headers)
+        match = MAX_AGE.search(response.headers.get("Cache-Control", ""))
+        self.max_age = float(match.group(1)) if match else 0
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        return [alert for page in iter_pages(response) for alert in page]
+
+def next_interval(interval: float, changed: bool, max_age: float = 0) -> float:
+    # Poll twice as often while alerts change, back off by half again while they do not
+    interval = max(WATCH_MIN_INTERVAL, interval / 2) if changed else min(WATCH_MAX_INTERVAL, interval * 1.5)
+    return max(interval, max_age)
+
+def change_records(changes: List[Tuple[str, Dict[str, Any]]], areas: AlertAreas, names: Dict[str, str], now: datetime) -> List[Dict[str, Any]]:
+    # One record per (change, county), with the same columns as the one-shot output
+    kinds = {alert.get("properties", {}).get("id"): kind for kind, alert in changes}
+    records = expand_alerts([alert for _, alert in changes], areas, names)
+    records.insert(0, "Change", records["AlertId"].map(kinds))
+    records.insert(1, "Time", now.isoformat())
+    return records.to_dict("records")
+
+def watch_alerts(polls: Optional[int] = None) -> int:
+    """
+    Polls the alert feed until interrupted (or for `polls` polls), keeping the
+    session warm and the active alerts in memory, and appends only new,
+    updated and expired alerts to CHANGES_FILENAME.
+    """
+    areas: AlertAreas = load_alert_areas()
+    names: Dict[str, str] = county_names()
+    index = AlertIndex()
+    poller = AlertPoller()
+    interval: float = WATCH_MIN_INTERVAL
+    count: int = 0
+    print(f"Watching {API_BASE_URL} every {WATCH_MIN_INTERVAL:g}-{WATCH_MAX_INTERVAL:g}s; changes go to {CHANGES_FILENAME}")
+    # JSON Lines so the file can be tailed while the watch runs
+    with open_sink(f'NWS_ALERT_CHANGES_{TIMESTAMP}', 'jsonl', batch_size=sys.maxsize) as sink:
+        try:
+            while polls is None or count < polls:
+                count += 1
+                now = datetime.now(timezone.utc)
+                try:
+                    with stage("fetch"):
+                        alerts = poller.poll()
+                except requests.exceptions.RequestException as e:
+                    # Keep watching through outages; the retry policy has already backed off
+                    print(f"{now:%H:%M:%S} poll failed: {e}", file=sys.stderr)
+                    alerts = None
+                with stage("filter"):
+                    changes = index.update(alerts, now) if alerts is not None else index.expire(now)
+                if changes:
+                    with stage("normalize"):
+                        records = change_records(changes, areas, names, now)
+                    with stage("write"):
+                        sink.write_many(records)
+                        sink.flush()
+                    for kind, alert in changes:
+                        properties = alert.get("properties", {})
+                        print(f"{now:%H:%M:%S} {kind:<8} {properties.get('event')} | {properties.get('headline')}")
+                interval = next_interval(interval, bool(changes), poller.max_age)
+                status = "not modified" if alerts is None else f"{len(alerts)} alerts"
+                print(f"{now:%H:%M:%S} poll {count}: {status}, {len(changes)} changes, {len(index)} active; next in {interval:.1f}s")
+                if polls is None or count < polls:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+    print(f"--- {sink.count} alert changes saved to {CHANGES_FILENAME} ---")
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if PROFILE_FLAG in argv:
+        return run_profiled(DATA_SOURCE, main, [arg for arg in argv if arg != PROFILE_FLAG])
+    if len(argv) == 0:
         print(f"Fetching {DATA_SOURCE} data from {API_BASE_URL} =>")
-    elif sys.argv[1] in ["--help", "-h", "/?"]:
-        print(f"Usage: {sys.argv[0]} [path_to_csv]")
-        sys.exit(0)
-    elif len(sys.argv) == 2:
-        CSV_FILE=sys.argv[1] # CSV file path passed as command-line argument
-        print(f"Fetching {DATA_SOURCE} data from {CSV_FILE}...")
+    elif argv[0] in ["--help", "-h", "/?"]:
+        print(f"Usage: {os.path.basename(__file__)} [path_to_csv] | --watch [polls] [{PROFILE_FLAG}]")
+        return 0
+    elif argv[0] == "--watch" and (len(argv) == 1 or (len(argv) == 2 and argv[1].isdigit() and int(argv[1]) > 0)):
+        # Long-running: emit only what changed between polls
+        return watch_alerts(int(argv[1]) if len(argv) > 1 else None)
+    elif len(argv) == 1:
+        csv_file = argv[0] # CSV file path passed as command-line argument
+        print(f"Fetching {DATA_SOURCE} data from {csv_file}...")
     else:
-        print(f"Usage: {sys.argv[0]} [path_to_csv]")
-        sys.exit(1)
+        print(f"Usage: {os.path.basename(__file__)} [path_to_csv] | --watch [polls] [{PROFILE_FLAG}]")
+        return 1
+    return write_alerts()
 
-main()
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,20 @@
 import os
 import sys
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
 
-import pandas as pd
 import requests
 from dotenv import load_dotenv
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from async_fetch import AsyncFetcher, iterate, paginate_offsets
+from campsite_filters import FILTER_PROFILE, Predicate, compile_profile_sql, index_page, load_profiles, load_specs
+from http_client import build_retry, create_session
+from profiling import PROFILE_FLAG, run_profiled, stage, staged
+from rate_control import current_limits
+from record_sinks import open_sink, output_path
+from ridb_store import RidbStore, full_sync_due, newest
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,8 +22,13 @@ load_dotenv()
 # Set Globals
 DATA_SOURCE: str = 'REC_RIDB'                                 # Name of data source. eg. "USDA_NASS"
 TIMESTAMP: str = f'{datetime.now():%Y%m%dT%H%M%S}'            # Current timestamp
-OUTPUT_CSV: str = f'{DATA_SOURCE}_{TIMESTAMP}.csv'            # Output filename
-facilities= set()
+OUTPUT_CSV: str = output_path(f'{DATA_SOURCE}_{TIMESTAMP}')   # Output filename (extension follows OUTPUT_FORMAT)
+PAGE_SIZE: int = int(os.environ.get('RIDB_PAGE_SIZE', 50))    # Records per page request (RIDB maximum is 50)
+MAX_WORKERS: int = int(os.environ.get('RIDB_WORKERS', 8))     # Concurrent page requests
+FACILITY_MODE: str = os.environ.get('RIDB_FACILITY_MODE', 'bulk')  # "bulk" (prefetch all facilities) or "single" (one lookup per match)
+SYNC_MODE: str = os.environ.get('RIDB_SYNC_MODE', 'delta')    # "delta" (sync changes into the local store, filter there) or "crawl" (filter a full crawl)
+STATUS_FORCELIST: List[int] = [502, 503, 504, 429]            # Retried statuses, for the session and the page crawls
+FULL_SYNC_DAYS: float = float(os.environ.get('RIDB_FULL_SYNC_DAYS', 30))   # Days between full syncs, which also drop deleted records
 API_KEY: Optional[str] = os.environ.get(f'{DATA_SOURCE}_API_KEY')
 API_BASE_URL: Dict[str, str] = {
     'CAMPSITES': 'https://ridb.recreation.gov/api/v1/campsites',
@@ -28,98 +40,192 @@ HEADERS = {
     "apikey": API_KEY
 }
 
-# Define the retry strategy
-retries = Retry(
-    total=5,                                # Maximum 5 retries
-    backoff_factor=1,                       # Exponential backoff (1s, 2s, 4s, etc.)
-    status_forcelist=[502, 503, 504, 429],  # Retry on these HTTP status codes
-    allowed_methods=["GET"]                 # Apply retry only to GET requests
-)
+# Cache responses on disk between runs: campsite and facility details change slowly
+CACHE_TTL: int = 24 * 3600
 
-# Create a session and mount the adapter
-session = requests.Session()
-session.mount("https://", HTTPAdapter(max_retries=retries))
-session.headers.update(HEADERS)
+# Create a pooled session for the facility lookups (page crawls run on the async fetch engine)
+session: requests.Session = create_session(
+    DATA_SOURCE,
+    headers=HEADERS,
+    pools={"https://ridb.recreation.gov/": MAX_WORKERS + 1},
+    retries=build_retry(total=5, backoff_factor=1, status_forcelist=STATUS_FORCELIST),
+    cache_ttl=CACHE_TTL,
+)
 
 # Define prototypes
 # example: List[Dict[str, Any]] = []
 
-# Fetch data from API
-def fetch_data(url: str, params: Dict[str, Any]) -> List[Any]:
-    metadata = session.get(url, params=params)
-    metadata.raise_for_status()
-    total_count: int = metadata.json().get("METADATA", {}).get("RESULTS", {}).get("TOTAL_COUNT", 0)
-    if total_count == 0:
-        raise ValueError("No results found")
+class NoResults(ValueError):
+    """
+    The endpoint lists no records for the query (TOTAL_COUNT is 0).
+    """
+
+async def crawl_pages(url: str, limit: int, workers: int, params: Optional[Dict[str, Any]]) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    async with AsyncFetcher(DATA_SOURCE, headers=HEADERS, host_concurrency=workers, status_forcelist=STATUS_FORCELIST, cache_ttl=CACHE_TTL) as fetcher:
+        async for offset, page in paginate_offsets(fetcher, url, limit, params, window=workers):
+            yield offset, page
+
+def fetch_pages(url: str, key: str, limit: int = PAGE_SIZE, workers: int = MAX_WORKERS, params: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[int, List[Any]]]:
+    """
+    Yields (offset, records) for every page of an offset-paginated RIDB endpoint.
+    Pages are crawled on the async fetch engine (see async_fetch.py): the first
+    page supplies TOTAL_COUNT, then at most `workers` pages are in flight and
+    they are yielded in offset order.
+    """
+    for offset, page in iterate(crawl_pages(url, limit, workers, params)):
+        if offset == 0:
+            total_count: int = page.get("METADATA", {}).get("RESULTS", {}).get("TOTAL_COUNT", 0)
+            if total_count == 0:
+                raise NoResults("No results found")
+            print(f'Fetching: {total_count} total records: {limit} records at a time, {workers} pages in flight')
+        yield offset, page.get(key, [])
+
+# Fetch details (with organizations) for a single facility
+def fetch_facility(facility_id: str) -> Dict[str, Any]:
+    facility_url: str = API_BASE_URL.get("FACILITIES", "")
+    facility_response = session.get(f"{facility_url}/{facility_id}", params={"full": "true"})
+    facility_response.raise_for_status()
+    return facility_response.json()
+
+# Page through every facility once and index it by FacilityID
+def build_facility_index() -> Dict[str, Dict[str, Any]]:
+    facility_url: str = API_BASE_URL.get("FACILITIES", "")
+    index: Dict[str, Dict[str, Any]] = {}
+    for _, chunk in staged("fetch", fetch_pages(facility_url, "RECDATA", params={"full": "true"})):
+        for facility in chunk:
+            index[str(facility.get("FacilityID"))] = facility
+    print(f"Indexed {len(index)} facilities.")
+    return index
+
+# Combine a campsite with its facility and organization details
+def enrich_campsite(campsite: Dict[str, Any], facility_id: str, facility_data: Dict[str, Any]) -> Dict[str, Any]:
+    organization_data = (facility_data.get("ORGANIZATION") or [{}])[0]
+    return {
+        **campsite,
+        "FacilityID": facility_id,
+        "FacilityName": facility_data.get("FacilityName"),
+        "FacilityTypeDescription": facility_data.get("FacilityTypeDescription"),
+        "FacilityLongitude": facility_data.get("FacilityLongitude"),
+        "FacilityLatitude": facility_data.get("FacilityLatitude"),
+        "FacilityOrganization": facility_data.get("ORGANIZATION", []),
+        "OrgId": organization_data.get("OrgID", None),
+        "OrgName": organization_data.get("OrgName", None),
+        "OrgType": organization_data.get("OrgType", None),
+        "OrgAbbrevName": organization_data.get("OrgAbbrevName", None)
+    }
+
+# Fetch data from API, yielding each matching campsite as soon as it is enriched
+def iter_campsites(url: str, params: Dict[str, Any], facility_mode: str = FACILITY_MODE, matches: Optional[Predicate] = None) -> Iterator[Dict[str, Any]]:
     key: str = params.get("KEY", "")
-    records: List[Any] = []
-    offset: int = 0  # Initialize OFFSET locally
-    limit: int = 50
-    print(f'Fetching: {total_count} total records: {limit} records at a time')
-    # while offset < 200:  # Limit to first 200 records for testing
-    while offset < total_count:
-        response = session.get(url, params={"limit": limit, "offset": offset})
-        response.raise_for_status()
-        chunk = response.json().get(key, [])
-        for campsite in chunk:
-            permitted = campsite.get("PERMITTEDEQUIPMENT", [])
-            campsiteType = campsite.get("CampsiteType", [])
-            attributes = campsite.get("ATTRIBUTES", [])
+    found: int = 0
+    facilities: Set[Any] = set()       # One campsite per facility
+    limit: int = PAGE_SIZE
+    matches = matches or load_profiles()[FILTER_PROFILE]
+    facility_index: Dict[str, Dict[str, Any]] = build_facility_index() if facility_mode == "bulk" else {}
+    for offset, chunk in staged("fetch", fetch_pages(url, key, limit)):
+        for campsite, view in zip(chunk, index_page(chunk)):
             facility_id = campsite.get("FacilityID")
-            if facility_id not in facilities \
-                and any(item in campsiteType.upper() for item in ["STANDARD", "RV"]) \
-                and any("RV" in eq.get("EquipmentName", "") for eq in permitted) \
-                and any(attr.get("AttributeName").upper() == "WATER HOOKUP" and attr.get("AttributeValue").upper() == "YES" for attr in attributes) \
-                and any(attr.get("AttributeName").upper() == "ELECTRICITY HOOKUP" and attr.get("AttributeValue").upper() != "N/A" for attr in attributes) \
-                and any(attr.get("AttributeName").upper() == "SEWER HOOKUP" and attr.get("AttributeValue").upper() != "N/A" for attr in attributes):
-                
-                # Fetch facility details
-                facility_url: str = API_BASE_URL.get("FACILITIES", "")
-                facility_response = session.get(f"{facility_url}/{facility_id}", params={"full": "true"})
-                facility_response.raise_for_status()
-                facility_data = facility_response.json()
-                organization_data = facility_data.get("ORGANIZATION")[0] if facility_data.get('ORGANIZATION', None) is not None else {}
-
-                # Combine records
-                record = {
-                    **campsite,
-                    "FacilityID": facility_id,
-                    "FacilityName": facility_data.get("FacilityName"),
-                    "FacilityTypeDescription": facility_data.get("FacilityTypeDescription"),
-                    "FacilityLongitude": facility_data.get("FacilityLongitude"),
-                    "FacilityLatitude": facility_data.get("FacilityLatitude"),
-                    "FacilityOrganization": facility_data.get("ORGANIZATION", []),
-                    "OrgId": organization_data.get("OrgID", None),
-                    "OrgName": organization_data.get("OrgName", None),
-                    "OrgType": organization_data.get("OrgType", None),
-                    "OrgAbbrevName": organization_data.get("OrgAbbrevName", None)
-                }
+            if facility_id not in facilities and matches(view):
+                # Join facility details from the index, fetching only IDs it does not hold
+                facility_data = facility_index.get(str(facility_id))
+                if facility_data is None:
+                    facility_data = fetch_facility(facility_id)
+                record = enrich_campsite(campsite, facility_id, facility_data)
                 facilities.add(facility_id)
-                records.append(record)
-        print(f"Fetched {len(chunk)} records ({offset}-{offset + limit}); found {len(records)} matches so far.")
-        offset += limit
-        if offset >= total_count:
-            break
-    return records
+                found += 1
+                yield record
+        print(f"Fetched {len(chunk)} records ({offset}-{offset + limit}); found {found} matches so far.")
 
-# Main execution
-if __name__ == "__main__":
-    if len(sys.argv) == 1:
+# RIDB's lastupdated filter takes mm-dd-yyyy; watermarks are LastUpdatedDate values (yyyy-mm-dd...)
+def lastupdated_param(watermark: str) -> str:
+    return datetime.strptime(watermark[:10], "%Y-%m-%d").strftime("%m-%d-%Y")
+
+def sync_endpoint(store: RidbStore, endpoint: str, params: Dict[str, Any]) -> int:
+    """
+    Brings one endpoint's table up to date: only records updated since the
+    stored watermark are requested, except every FULL_SYNC_DAYS, when the
+    whole endpoint is crawled and records it no longer lists are dropped.
+    Returns the number of records stored.
+    """
+    state = store.sync_state(endpoint)
+    full = full_sync_due(state, FULL_SYNC_DAYS * 24 * 3600)
+    watermark: Optional[str] = None if full else state["watermark"]
+    upsert = store.upsert_campsites if endpoint == "campsites" else store.upsert_facilities
+    query = {**params, "lastupdated": lastupdated_param(watermark)} if watermark else params
+    print(f"Syncing {endpoint} {'in full' if full else f'updated since {watermark}'}...")
+    started = time.time()
+    latest = state["watermark"]
+    stored = 0
+    try:
+        for _, chunk in staged("fetch", fetch_pages(API_BASE_URL[endpoint.upper()], "RECDATA", params=query)):
+            # The date filter is inclusive and day-grained: same-day records are simply stored again
+            if watermark:
+                chunk = [record for record in chunk if (record.get("LastUpdatedDate") or "") >= watermark]
+            with stage("write"):
+                stored += upsert(chunk, started)
+            latest = newest(chunk, latest)
+    except NoResults:
+        # Nothing listed: no changes since the watermark. Any other error propagates before the watermark
+        # moves or anything is pruned, since pages arrive in offset order, not LastUpdatedDate order
+        pass
+    if full and stored > 0:
+        print(f"Dropped {store.prune(endpoint, started)} {endpoint} no longer listed.")
+    store.set_sync_state(endpoint, latest, started, full and stored > 0)
+    print(f"Stored {stored} {endpoint}; {store.count(endpoint)} in {store.path}.")
+    return stored
+
+# Campsites matching a filter profile, queried from the synced store and joined with their facility
+# (in "single" facility mode every match's facility is looked up afresh, as in a crawl)
+def iter_stored_campsites(store: RidbStore, profile: Dict[str, Any], facility_mode: str = FACILITY_MODE) -> Iterator[Dict[str, Any]]:
+    where, params = compile_profile_sql(profile)
+    facilities: Set[Any] = set()       # One campsite per facility
+    for campsite, facility_data in list(store.query(where, params)):
+        facility_id = campsite.get("FacilityID")
+        if facility_id in facilities:
+            continue
+        if facility_data is None or facility_mode == "single":
+            facility_data = fetch_facility(facility_id)
+            store.upsert_facilities([facility_data], time.time())
+        facilities.add(facility_id)
+        yield enrich_campsite(campsite, facility_id, facility_data)
+
+def fetch_data(url: str, params: Dict[str, Any], facility_mode: str = FACILITY_MODE, matches: Optional[Predicate] = None) -> List[Any]:
+    return list(iter_campsites(url, params, facility_mode, matches))
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if PROFILE_FLAG in argv:
+        return run_profiled(DATA_SOURCE, main, [arg for arg in argv if arg != PROFILE_FLAG])
+    if len(argv) == 0:
         camp_url: Optional[str] = API_BASE_URL.get("CAMPSITES", "")
         print(f"Fetching {DATA_SOURCE} data from {camp_url} =>")
-        campsites = fetch_data(camp_url, {"KEY": "RECDATA" })
-        if len(campsites) > 0:
-            print(f"--- {DATA_SOURCE} data fetched: {len(campsites)} records ---")
+        if SYNC_MODE == "delta":
+            with RidbStore() as store:
+                # "single" mode skips the facility sync: only the facilities of matches are looked up
+                if FACILITY_MODE == "bulk":
+                    sync_endpoint(store, "facilities", {"full": "true"})
+                sync_endpoint(store, "campsites", {})
+                with stage("write"), open_sink(f'{DATA_SOURCE}_{TIMESTAMP}') as sink:
+                    sink.write_many(staged("filter", iter_stored_campsites(store, load_specs()[FILTER_PROFILE])))
+        else:
+            # Matches are flattened and flushed to disk in batches as the crawl runs
+            with stage("write"), open_sink(f'{DATA_SOURCE}_{TIMESTAMP}') as sink:
+                sink.write_many(staged("filter", iter_campsites(camp_url, {"KEY": "RECDATA" })))
+        for host, limits in current_limits({urlsplit(url).netloc for url in API_BASE_URL.values()}).items():
+            print(f"Rate limits for {host}: {limits}")
+        if sink.count > 0:
+            print(f"--- {DATA_SOURCE} data fetched: {sink.count} records ---")
             print(f"--- Saved to {OUTPUT_CSV} ---")
-            df: pd.DataFrame = pd.json_normalize(campsites)
-            # df.to_csv(sys.stdout, index=False)
-            df.to_csv(OUTPUT_CSV, index=False)
-    elif sys.argv[1] in ["--help", "-h", "/?"]:
-        print(f"Usage: {sys.argv[0]} [path_to_csv]")
-        sys.exit(0)
-    elif len(sys.argv) == 2:
-        CSV_FILE=sys.argv[1] # CSV file path passed as command-line argument
-        print(f"Fetching {DATA_SOURCE} data from {CSV_FILE}...")
+    elif argv[0] in ["--help", "-h", "/?"]:
+        print(f"Usage: {os.path.basename(__file__)} [path_to_csv] [{PROFILE_FLAG}]")
+    elif len(argv) == 1:
+        csv_file = argv[0] # CSV file path passed as command-line argument
+        print(f"Fetching {DATA_SOURCE} data from {csv_file}...")
     else:
-        print(f"Usage: {sys.argv[0]} [path_to_csv]")
-        sys.exit(1)
+        print(f"Usage: {os.path.basename(__file__)} [path_to_csv] [{PROFILE_FLAG}]")
+        return 1
+    return 0
+
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,17 @@
+import asyncio
 import os
 import sys
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-import pandas as pd
 import requests
 from dotenv import load_dotenv
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from async_fetch import AsyncFetcher, fan_out
+from county_index import county_key
+from http_client import create_session
+from profiling import PROFILE_FLAG, run_profiled, stage
+from record_sinks import open_sink, output_path
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,23 +20,15 @@ load_dotenv()
 DATA_SOURCE: str = "NASS_USDA"
 API_BASE_URL: str = "https://quickstats.nass.usda.gov/api/api_GET/"
 TIMESTAMP: str = f"{datetime.now():%Y%m%dT%H%M%S}"
-OUTPUT_FILENAME: str = f"NASS_USDA_{TIMESTAMP}.csv"
+OUTPUT_FILENAME: str = output_path(f"NASS_USDA_{TIMESTAMP}")
 API_KEY = os.environ.get('NASS_API_KEY') # https://quickstats.nass.usda.gov/api
-records: List[Dict] = []
-
-# Define the retry strategy
-retries = Retry(
-    total=10,                                       # Maximum 5 retries
-    backoff_factor=3,                               # Exponential backoff (1s, 2s, 4s, etc.)
-    status_forcelist=[502, 503, 504, 429, 403],     # Retry on these HTTP status codes
-    allowed_methods=["GET"],                        # Apply retry only to GET requests
-    backoff_max=60                                  # Maximum backoff time of 60 seconds
-)
-
-# Create a session and mount the adapter
-session: requests.Session = requests.Session()
-session.mount("https://", HTTPAdapter(max_retries=retries))
-# session.headers.update(HEADERS)
+BATCH_MODE: str = os.environ.get('NASS_BATCH_MODE', 'state')   # "state" (one request per state), "national" (one request) or "county" (one request per county)
+
+# Cache responses on disk between runs: census values change at most yearly
+CACHE_TTL: int = 30 * 24 * 3600
+
+# Create a pooled session with the shared retry policy and timeouts
+session: requests.Session = create_session(DATA_SOURCE, cache_ttl=CACHE_TTL)
 
 # Define the list of counties to include: (county, state_abbr, focus_area)
 # Waring: Check spelling and spaces! LaPaz != La Paz, Le Flore != LeFlore, etc.
@@ -141,23 +137,28 @@ zones = {
         '12': 1,
 }
 
+# QuickStats filters shared by every price lookup
+QUERY_PARAMS: Dict[str, str] = {
+    "source_desc": "CENSUS",
+    "sector_desc": "ECONOMICS",
+    "group_desc": "FARMS & LAND & ASSETS",
+    "commodity_desc": "AG LAND",
+    "statisticcat_desc": "ASSET VALUE",
+    "short_desc": "AG LAND, INCL BUILDINGS - ASSET VALUE, MEASURED IN $ / ACRE",
+    "domain_desc": "TOTAL",
+    "agg_level_desc": "COUNTY",
+    "year": "2022",
+    "reference_period_desc": "END OF DEC",
+    "format": "JSON"
+}
+
 # Fetch average price per acre from USDA NASS API
 def get_avg_price(state_name: str, county_name: str) -> float | None:
     params = {
         "key": API_KEY,
-        "source_desc": "CENSUS",
-        "sector_desc": "ECONOMICS",
-        "group_desc": "FARMS & LAND & ASSETS",
-        "commodity_desc": "AG LAND",
-        "statisticcat_desc": "ASSET VALUE",
-        "short_desc": "AG LAND, INCL BUILDINGS - ASSET VALUE, MEASURED IN $ / ACRE",
-        "domain_desc": "TOTAL",
-        "agg_level_desc": "COUNTY",
+        **QUERY_PARAMS,
         "state_name": state_name.upper(),
         "county_name": county_name.upper(),
-        "year": "2022",
-        "reference_period_desc": "END OF DEC",
-        "format": "JSON"
     }
     response: requests.Response = session.get(API_BASE_URL, params=params)
     response.raise_for_status()
@@ -167,40 +168,101 @@ def get_avg_price(state_name: str, county_name: str) -> float | None:
         return data["data"][0].get("Value")
     return None
 
-# Main execution
-if __name__ == "__main__":
-    if len(sys.argv) == 1:
+# Fetch price per acre for every county in a state (or nationally) in a single request
+def get_county_prices(state_name: Optional[str] = None) -> Dict[Tuple[str, str], str]:
+    params = {"key": API_KEY, **QUERY_PARAMS}
+    if state_name:
+        params["state_name"] = state_name.upper()
+    response: requests.Response = session.get(API_BASE_URL, params=params)
+    # QuickStats answers 400 {"error": ["no data"]} when nothing matches the filters
+    if response.status_code == 400 and "no data" in response.text.lower():
+        return {}
+    response.raise_for_status()
+    prices: Dict[Tuple[str, str], str] = {}
+    for row in response.json().get("data", []):
+        # Keep the first row per county, as get_avg_price does
+        prices.setdefault((row.get("state_alpha", ""), county_key(row.get("county_name", ""))), row.get("Value"))
+    return prices
+
+# Fetch every county's price concurrently, one request per county
+async def fetch_county_prices(places: List[Tuple[str, str, int]]) -> Dict[Tuple[str, str], str]:
+    async with AsyncFetcher(DATA_SOURCE, cache_ttl=CACHE_TTL) as fetcher:
+        async def fetch(place: Tuple[str, str]) -> Optional[str]:
+            abbr, county = place
+            params = {"key": API_KEY, **QUERY_PARAMS, "state_name": f"{states.get(abbr)}".upper(), "county_name": county.upper()}
+            response = await fetcher.get(API_BASE_URL, params, raise_for_status=False)
+            if response.status_code == 400 and "no data" in response.text.lower():
+                return None
+            response.raise_for_status()
+            rows = response.json().get("data", [])
+            return rows[0].get("Value") if rows else None
+
+        found = await fan_out([(abbr, county) for county, abbr, _ in places], fetch)
+    return {(abbr, county_key(county)): value for (abbr, county), value in found.items() if value is not None}
+
+# Build a (state_abbr, county_key) -> price index covering every requested county
+def build_price_index(places: List[Tuple[str, str, int]], mode: str = BATCH_MODE) -> Dict[Tuple[str, str], str]:
+    if mode == "national":
+        print("Fetching county prices nationally in one request")
+        return get_county_prices()
+    if mode == "county":
+        print(f"Fetching county prices for {len(places)} counties concurrently")
+        return asyncio.run(fetch_county_prices(places))
+    prices: Dict[Tuple[str, str], str] = {}
+    abbrs: Set[str] = {abbr for _, abbr, _ in places}
+    for abbr in sorted(abbrs):
+        print(f"Fetching county prices for {states.get(abbr)}")
+        prices.update(get_county_prices(f'{states.get(abbr)}'))
+    return prices
+
+# Look up a county price in the index, or query the county directly when no index was built
+def lookup_price(prices: Optional[Dict[Tuple[str, str], str]], state_name: str, abbr: str, county_name: str) -> float | None:
+    if prices is None:
+        return get_avg_price(state_name, county_name.upper())
+    return prices.get((abbr, county_key(county_name)))
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if PROFILE_FLAG in argv:
+        return run_profiled(DATA_SOURCE, main, [arg for arg in argv if arg != PROFILE_FLAG])
+    if len(argv) == 0:
         print(f"Fetching {DATA_SOURCE} data from {API_BASE_URL} =>")
-    elif sys.argv[1] in ["--help", "-h", "/?"]:
-        print(f"Usage: {sys.argv[0]} [path_to_csv]")
-        sys.exit(0)
-    elif len(sys.argv) == 2:
-        SOURCE=sys.argv[1] # CSV file path passed as command-line argument
-        print(f"Fetching FEMA NRI data from {SOURCE}...")
+    elif argv[0] in ["--help", "-h", "/?"]:
+        print(f"Usage: {os.path.basename(__file__)} [path_to_csv] [{PROFILE_FLAG}]")
+        return 0
+    elif len(argv) == 1:
+        source = argv[0] # CSV file path passed as command-line argument
+        print(f"Fetching {DATA_SOURCE} data from {source}...")
     else:
-        print(f"Usage: {sys.argv[0]} [path_to_csv]")
-        sys.exit(1)
-
-
-# TODO: Read CSV from argv[1] if provided, otherwise use API_BASE_URL
-for county, abbr, focus_area in counties:
-    state: str = f'{states.get(abbr)}'
-    record = {
-        "Place Names": f"{county} County, {abbr}",
-        "COUNTY": county.upper(),
-        "STATE": f"{states.get(abbr)}".upper(),
-        "STATE_ABV": abbr,
-        "ZONE": zones.get(focus_area.__str__()),
-        "FOCUS_AREA": focus_area,
-        "LANDWATCH_URL": f'https://www.landwatch.com/{state.lower().replace(" ", "-")}-land-for-sale/{county.lower().replace(" ", "-")}-county/price-under-49999/acres-under-50//sort-price-low-high',
-        "PP_ACRE": f'{get_avg_price(state, county.upper())}'
-    }
-    records.append(record)
-    print(f"Processing: {record.get('Place Names')}")
-
-if len(records) > 0:
-    print(f"--- {DATA_SOURCE} data fetched: {len(records)} records ---")
-    print(f"--- Saved to {OUTPUT_FILENAME} ---")
-    df: pd.DataFrame = pd.json_normalize(records)
-    # df.to_csv(sys.stdout, index=False)
-    df.to_csv(OUTPUT_FILENAME, index=False)
+        print(f"Usage: {os.path.basename(__file__)} [path_to_csv] [{PROFILE_FLAG}]")
+        return 1
+
+    # TODO: Read CSV from argv[0] if provided, otherwise use API_BASE_URL
+    with stage("fetch"):
+        price_index = build_price_index(counties)
+    with open_sink(f"NASS_USDA_{TIMESTAMP}") as sink:
+        for county, abbr, focus_area in counties:
+            state: str = f'{states.get(abbr)}'
+            with stage("normalize"):
+                record = {
+                    "Place Names": f"{county} County, {abbr}",
+                    "COUNTY": county.upper(),
+                    "STATE": f"{states.get(abbr)}".upper(),
+                    "STATE_ABV": abbr,
+                    "ZONE": zones.get(focus_area.__str__()),
+                    "FOCUS_AREA": focus_area,
+                    "LANDWATCH_URL": f'https://www.landwatch.com/{state.lower().replace(" ", "-")}-land-for-sale/{county.lower().replace(" ", "-")}-county/price-under-49999/acres-under-50//sort-price-low-high',
+                    "PP_ACRE": f'{lookup_price(price_index, state, abbr, county)}'
+                }
+            with stage("write"):
+                sink.write(record)
+            print(f"Processing: {record.get('Place Names')}")
+
+    if sink.count > 0:
+        print(f"--- {DATA_SOURCE} data fetched: {sink.count} records ---")
+        print(f"--- Saved to {OUTPUT_FILENAME} ---")
+    return 0
+
+# Main execution
+if __name__ == "__main__":
+    sys.exit(main())
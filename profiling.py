@@ -0,0 +1,273 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+# Built-in profiling for sources and stages: pass --profile to main.py or to any parse_* script.
+# A run is split into stages (fetch, filter, normalize, write; anything outside them counts as "other"). Each stage
+# gets its own cProfile, wall and CPU time and tracemalloc peak, while a sampler thread records the run's call stacks.
+# Written to <PROFILE_DIR>/<source>_<timestamp>: .txt (per-stage report), .collapsed (stacks for flamegraph.pl or
+# speedscope) and .prof (pstats, e.g. for snakeviz).
+
+# Set Globals
+PROFILE_DIR: Path = Path(os.environ.get('PROFILE_DIR', 'profiles'))            # Where the reports go
+PROFILE_FLAG: str = '--profile'
+PROFILE_INTERVAL: float = float(os.environ.get('PROFILE_INTERVAL', 0.005))     # Seconds between stack samples
+PROFILE_MEMORY: bool = os.environ.get('PROFILE_MEMORY', 'on').lower() != 'off'   # Trace allocations (slows allocation-heavy code)
+PROFILE_FRAMES: int = 16                                                       # Frames kept per traced allocation
+TOP_FUNCTIONS: int = 15                                                        # Functions listed per stage
+TOP_ALLOCATIONS: int = 10                                                      # Allocation sites listed per stage
+SNAPSHOT_GROWTH: float = 1.1                                                   # Retake a stage's snapshot once its peak grows 10%
+UNSTAGED: str = 'other'
+ROOT: str = str(Path(__file__).resolve().parent)
+MIB: int = 1024 * 1024
+
+T = TypeVar("T")
+
+_local = threading.local()
+
+
+def in_repo(filename: str) -> bool:
+    return filename.startswith(ROOT) and "site-packages" not in filename
+
+def frame_label(code) -> str:
+    # module:function, the way the collapsed stacks name each frame
+    return f"{Path(code.co_filename).stem}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def allocation_sites(snapshot: tracemalloc.Snapshot, limit: int = TOP_ALLOCATIONS) -> List[str]:
+    # Live bytes grouped by the innermost line of this repo's code that led to the allocation
+    sites: Counter = Counter()
+    for stat in snapshot.statistics("traceback"):
+        frames = list(stat.traceback)
+        frame = next((frame for frame in reversed(frames) if in_repo(frame.filename)), frames[-1])
+        sites[f"{os.path.relpath(frame.filename, ROOT) if in_repo(frame.filename) else frame.filename}:{frame.lineno}"] += stat.size
+    return [f"{size / MIB:>9.2f} MiB  {site}" for site, size in sites.most_common(limit)]
+
+class StageStats:
+    """
+    Totals for one stage over all of its entries. allocations is a
+    tracemalloc snapshot taken as the stage neared its highest peak
+    (snapshot_peak), retaken only when the peak grows by SNAPSHOT_GROWTH.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.entries = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+        self.growth = 0
+        self.allocations: Optional[tracemalloc.Snapshot] = None
+        self.snapshot_peak = 0
+
+class Profiler:
+    """
+    Profiles the calling thread between start() and stop(). Stages nest: an
+    inner stage pauses the outer one, so each stage's times, cProfile and peak
+    memory cover only its own work. CPU time and cProfile cover the profiled
+    thread only, so waiting on worker threads (such as page prefetchers) shows
+    up as wall time in the stage that waits.
+    """
+
+    def __init__(self, source: str, interval: float = PROFILE_INTERVAL, memory: bool = PROFILE_MEMORY):
+        self.source = source
+        self.interval = interval
+        self.memory = memory
+        self.deterministic = True
+        self.stages: Dict[str, StageStats] = {}
+        self.stack: List[StageStats] = []
+        self.samples: Counter = Counter()
+        self.thread_id = threading.get_ident()
+        self.resumed = (0.0, 0.0, 0)
+        self.started = 0.0
+        self.traced = False
+        self.stopping = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, name=f"profile-{source}", daemon=True)
+
+    def stats(self, name: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+
+    def suspend(self) -> None:
+        # Credit the running stage with everything since it was (re)entered
+        current = self.stack[-1]
+        current.profile.disable()
+        wall, cpu, base = self.resumed
+        current.wall += time.perf_counter() - wall
+        current.cpu += time.thread_time() - cpu
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            current.growth = max(current.growth, peak - base)
+            current.peak = max(current.peak, peak)
+            if peak > current.snapshot_peak * SNAPSHOT_GROWTH:
+                current.snapshot_peak = peak
+                current.allocations = tracemalloc.take_snapshot()
+
+    def resume(self) -> None:
+        current = self.stack[-1]
+        base = 0
+        if self.memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        if self.deterministic:
+            try:
+                current.profile.enable()
+            except ValueError as e:
+                # Python 3.12+ allows one cProfile per interpreter: carry on with sampling only
+                print(f"Profiling {self.source} without cProfile: {e}", file=sys.stderr)
+                self.deterministic = False
+        self.resumed = (time.perf_counter(), time.thread_time(), base)
+
+    def enter(self, name: str) -> None:
+        self.suspend()
+        self.stack.append(self.stats(name))
+        self.stack[-1].entries += 1
+        self.resume()
+
+    def exit(self) -> None:
+        self.suspend()
+        self.stack.pop()
+        self.resume()
+
+    def sample(self) -> None:
+        # Wall-clock stack samples of the profiled thread, tagged with the stage running at the time
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = self.stack[-1:]
+            if frame is None or not stack:
+                continue
+            labels: List[str] = []
+            while frame is not None:
+                if frame.f_code.co_filename != __file__:
+                    labels.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            self.samples[";".join([self.source, stack[0].name] + labels[::-1])] += 1
+
+    def start(self) -> None:
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_FRAMES)
+            self.traced = True
+        self.started = time.perf_counter()
+        self.stack.append(self.stats(UNSTAGED))
+        self.stack[-1].entries += 1
+        self.resume()
+        self.sampler.start()
+        _local.profiler = self
+
+    def stop(self) -> None:
+        _local.profiler = None
+        self.stopping.set()
+        self.sampler.join()
+        self.suspend()
+        self.stack.clear()
+        if self.traced:
+            tracemalloc.stop()
+
+    def report(self, profiles: Dict[str, Optional[pstats.Stats]]) -> str:
+        total = time.perf_counter() - self.started
+        out = io.StringIO()
+        out.write(f"Profile of {self.source}: {total:.2f}s wall, {sum(self.samples.values())} stack samples every {self.interval * 1000:g}ms\n\n")
+        out.write(f"{'Stage':<12} {'Entries':>8} {'Wall(s)':>9} {'CPU(s)':>9} {'Wall%':>6} {'Peak(MiB)':>10} {'+MiB':>8}\n")
+        stages = sorted(self.stages.values(), key=lambda stage: stage.wall, reverse=True)
+        for stage in stages:
+            memory = f"{stage.peak / MIB:>10.1f} {stage.growth / MIB:>8.1f}" if self.memory else f"{'-':>10} {'-':>8}"
+            out.write(f"{stage.name:<12} {stage.entries:>8} {stage.wall:>9.2f} {stage.cpu:>9.2f} {100 * stage.wall / total if total else 0:>5.1f}% {memory}\n")
+        for stage in stages:
+            out.write(f"\n=== {stage.name}: top functions by cumulative time ===\n")
+            stats = profiles.get(stage.name)
+            if stats is None:
+                out.write("(no cProfile data)\n")
+            else:
+                stats.stream = out
+                stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            if stage.allocations is not None:
+                out.write(f"=== {stage.name}: largest live allocations at {stage.snapshot_peak / MIB:.1f} MiB ===\n")
+                out.write("\n".join(allocation_sites(stage.allocations)) + "\n")
+        return out.getvalue()
+
+    def write(self, directory: Path = PROFILE_DIR) -> List[Path]:
+        """
+        Writes the report, collapsed stacks and combined pstats; returns their paths.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        base = directory / f"{self.source}_{datetime.now():%Y%m%dT%H%M%S}"
+        profiles: Dict[str, Optional[pstats.Stats]] = {}
+        for stage in self.stages.values():
+            stage.profile.create_stats()
+            profiles[stage.name] = pstats.Stats(stage.profile) if stage.profile.stats else None
+        paths = [base.with_suffix(".txt"), base.with_suffix(".collapsed")]
+        paths[0].write_text(self.report(profiles))
+        paths[1].write_text("".join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items())))
+        combined = [stats for stats in profiles.values() if stats is not None]
+        if combined:
+            combined[0].add(*combined[1:])
+            combined[0].dump_stats(base.with_suffix(".prof"))
+            paths.append(base.with_suffix(".prof"))
+        return paths
+
+    def print_summary(self) -> None:
+        for stage in sorted(self.stages.values(), key=lambda stage: stage.wall, reverse=True):
+            peak = f", peak {stage.peak / MIB:.1f} MiB" if self.memory else ""
+            print(f"[profile] {self.source} {stage.name}: {stage.wall:.2f}s wall, {stage.cpu:.2f}s CPU{peak}")
+
+def active() -> Optional[Profiler]:
+    # The profiler of the run in this thread, if it is being profiled
+    return getattr(_local, "profiler", None)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Counts the enclosed work towards stage `name` of the running profile; does
+    nothing when the thread is not being profiled. Must not span a yield.
+    """
+    profiler = active()
+    if profiler is None:
+        yield
+        return
+    profiler.enter(name)
+    try:
+        yield
+    finally:
+        profiler.exit()
+
+def staged(name: str, iterable: Iterable[T]) -> Iterator[T]:
+    # Yields from iterable, counting the work of producing each item (e.g. fetching a page) towards stage `name`
+    if active() is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+def run_profiled(source: str, main: Callable[[List[str]], int], argv: List[str]) -> int:
+    """
+    Runs main(argv) under a Profiler and writes its reports; used by every
+    entry point when PROFILE_FLAG is on its command line.
+    """
+    if active() is not None:
+        return main(argv)
+    profiler = Profiler(source)
+    profiler.start()
+    try:
+        return main(argv)
+    finally:
+        profiler.stop()
+        profiler.print_summary()
+        for path in profiler.write():
+            print(f"--- Profile saved to {path} ---")
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+
+from http_metrics import record_queue, record_retry
+
+# Adaptive per-host rate control: a token bucket for request rate plus an AIMD concurrency limit.
+# Throttling (429, or 403/503 with Retry-After) halves both and pauses the host; successes grow them back.
+# Usage: session.mount(prefix, RateLimitedAdapter(adapter)); current_limits() reports every host.
+
+# Set Globals
+INITIAL_RATE: float = float(os.environ.get('HTTP_RATE', 10))                # Requests per second per host to start with
+MAX_RATE: float = float(os.environ.get('HTTP_MAX_RATE', 50))                # Ceiling for additive increase
+MIN_RATE: float = 0.1                                                       # Floor for multiplicative decrease
+MAX_CONCURRENCY: int = int(os.environ.get('HTTP_MAX_CONCURRENCY', 16))      # Ceiling for in-flight requests per host
+MAX_THROTTLE_RETRIES: int = 8                                               # Throttled responses retried before giving up
+DEFAULT_PAUSE: float = 5                                                    # Seconds to pause a host throttled without Retry-After
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either delta-seconds or an HTTP-date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    # Rate-limit reset headers are seconds from now, or an epoch timestamp on some APIs
+    if not value:
+        return None
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    return max(0.0, reset - time.time()) if reset > 1e9 else reset
+
+def header(headers, *names: str) -> Optional[str]:
+    for name in names:
+        if name in headers:
+            return headers[name]
+    return None
+
+class HostLimiter:
+    """
+    Token bucket (rate, burst) and AIMD concurrency limit for one host.
+    acquire() blocks until a request may start (try_acquire() is the non-blocking
+    form, for callers on an event loop); release() feeds the response back.
+    """
+
+    def __init__(self, host: str, rate: float = INITIAL_RATE, concurrency: int = MAX_CONCURRENCY):
+        self.host = host
+        self.rate = rate
+        self.concurrency = float(concurrency)
+        self.tokens = 1.0
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.throttled = 0
+        self.condition = threading.Condition()
+
+    def refill(self, now: float) -> None:
+        # Allow a burst of up to one second of requests
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> Tuple[bool, Optional[float]]:
+        # Takes a slot if one is free now; otherwise (False, seconds to wait), None meaning until a release
+        with self.condition:
+            now = time.monotonic()
+            self.refill(now)
+            if now < self.paused_until:
+                return False, self.paused_until - now
+            if self.in_flight >= int(self.concurrency):
+                return False, None
+            if self.tokens < 1:
+                return False, (1 - self.tokens) / self.rate
+            self.tokens -= 1
+            self.in_flight += 1
+            self.requests += 1
+            return True, None
+
+    def acquire(self) -> None:
+        with self.condition:
+            while True:
+                acquired, wait = self.try_acquire()
+                if acquired:
+                    return
+                self.condition.wait(wait)
+
+    def release(self, response: Optional[requests.Response]) -> bool:
+        # Returns True when the response was a throttle and the request should be retried
+        with self.condition:
+            self.in_flight -= 1
+            throttled = response is not None and self.is_throttle(response)
+            if throttled:
+                self.throttled += 1
+                self.rate = max(MIN_RATE, self.rate / 2)
+                self.concurrency = max(1.0, self.concurrency / 2)
+                pause = parse_retry_after(response.headers.get("Retry-After"))
+                self.pause(DEFAULT_PAUSE if pause is None else pause)
+            elif response is not None and response.status_code < 400:
+                self.rate = min(MAX_RATE, self.rate + 1 / self.rate)
+                self.concurrency = min(float(MAX_CONCURRENCY), self.concurrency + 1 / self.concurrency)
+            if response is not None:
+                self.apply_rate_headers(response)
+            self.condition.notify_all()
+            return throttled
+
+    @staticmethod
+    def is_throttle(response: requests.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        # 403/503 only count as throttling when the server says when to come back
+        return response.status_code in (403, 503) and "Retry-After" in response.headers
+
+    def apply_rate_headers(self, response: requests.Response) -> None:
+        remaining = header(response.headers, "X-RateLimit-Remaining", "RateLimit-Remaining")
+        reset = parse_reset(header(response.headers, "X-RateLimit-Reset", "RateLimit-Reset"))
+        try:
+            remaining = int(remaining) if remaining is not None else None
+        except ValueError:
+            remaining = None
+        if remaining is None:
+            return
+        if remaining <= 0:
+            self.pause(reset if reset is not None else DEFAULT_PAUSE)
+        elif reset:
+            # Spread what is left of the quota over the rest of the window
+            self.rate = max(MIN_RATE, min(self.rate, remaining / reset))
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                "rate": round(self.rate, 3),
+                "concurrency": int(self.concurrency),
+                "in_flight": self.in_flight,
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3),
+                "requests": self.requests,
+                "throttled": self.throttled,
+            }
+
+_limiters: Dict[str, HostLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(host: str) -> HostLimiter:
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = HostLimiter(host)
+        return _limiters[host]
+
+def current_limits(hosts: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    # Every host's limits, or only those of the given hosts (the limiters are shared by all sources in the process)
+    with _limiters_lock:
+        limiters = [limiter for host, limiter in _limiters.items() if hosts is None or host in hosts]
+    return {limiter.host: limiter.snapshot() for limiter in limiters}
+
+class RateLimitedAdapter(BaseAdapter):
+    """
+    Transport adapter that admits requests through their host's limiter and
+    retries throttled responses after the pause the server asked for.
+    """
+
+    def __init__(self, adapter: BaseAdapter, max_throttle_retries: int = MAX_THROTTLE_RETRIES):
+        super().__init__()
+        self.adapter = adapter
+        self.max_throttle_retries = max_throttle_retries
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        limiter = get_limiter(urlsplit(request.url).netloc)
+        for attempt in range(self.max_throttle_retries + 1):
+            start = time.perf_counter()
+            limiter.acquire()
+            # Waiting out a throttle pause is backoff; waiting for a slot on the first attempt is queueing
+            if attempt:
+                record_retry(backoff=time.perf_counter() - start)
+            else:
+                record_queue(time.perf_counter() - start)
+            response: Optional[requests.Response] = None
+            try:
+                response = self.adapter.send(request, **kwargs)
+            finally:
+                throttled = limiter.release(response)
+            if not throttled or attempt == self.max_throttle_retries:
+                return response
+            print(f"Throttled by {limiter.host} ({response.status_code}); retrying at {limiter.rate:.2f} req/s")
+            response.close()
+        return response
+
+    def close(self) -> None:
+        self.adapter.close()
@@ -0,0 +1,213 @@
+import csv
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+# Incremental record writers: rows are flattened once and flushed in batches, so memory stays bounded
+# and a crash late in a run keeps everything written so far.
+# Usage: with open_sink(f'{DATA_SOURCE}_{TIMESTAMP}') as sink: sink.write_many(records)
+
+# Set Globals
+OUTPUT_FORMAT: str = os.environ.get('OUTPUT_FORMAT', 'csv').lower()    # csv, parquet or jsonl
+BATCH_SIZE: int = int(os.environ.get('OUTPUT_BATCH_SIZE', 500))         # Rows per flush (and Parquet row group)
+EXTENSIONS: Dict[str, str] = {"csv": "csv", "parquet": "parquet", "jsonl": "jsonl"}
+
+
+def flatten(record: Dict[str, Any], prefix: str = "", sep: str = ".") -> Dict[str, Any]:
+    # Same column naming as pd.json_normalize: nested dicts become "parent.child", lists are kept whole
+    flat: Dict[str, Any] = {}
+    for key, value in record.items():
+        name = f"{prefix}{sep}{key}" if prefix else str(key)
+        if isinstance(value, dict) and value:
+            flat.update(flatten(value, name, sep))
+        else:
+            flat[name] = value
+    return flat
+
+def output_path(stem: str, fmt: str = OUTPUT_FORMAT) -> str:
+    return f"{stem}.{EXTENSIONS[fmt]}"
+
+class RecordSink:
+    """
+    Buffers records and hands them to write_batch() every batch_size rows.
+    The output file is only created once the first batch is flushed.
+    """
+
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE, fields: Optional[List[str]] = None):
+        self.path = path
+        self.batch_size = batch_size
+        self.fields = fields
+        self.buffer: List[Dict[str, Any]] = []
+        self.count = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        for record in records:
+            self.write(record)
+        return self.count
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.write_batch(self.buffer)
+            self.count += len(self.buffer)
+            self.buffer = []
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "RecordSink":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class CSVSink(RecordSink):
+    """
+    CSV with a fixed schema: the given fields, or the columns of the first
+    batch. Columns that only appear later are dropped (reported once).
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(path, **kwargs)
+        self.file = None
+        self.writer: Optional[csv.DictWriter] = None
+        self.dropped: set = set()
+
+    def open(self) -> None:
+        self.file = open(self.path, "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fields, extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        rows = [flatten(record) for record in batch]
+        if self.writer is None:
+            if self.fields is None:
+                self.fields = list(dict.fromkeys(key for row in rows for key in row))
+            self.open()
+        for row in rows:
+            extra = row.keys() - set(self.fields) - self.dropped
+            if extra:
+                print(f"{self.path}: dropping columns not in the schema: {', '.join(sorted(extra))}")
+                self.dropped |= extra
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self) -> None:
+        super().close()
+        # With a known schema an empty run still leaves a header-only file behind
+        if self.writer is None and self.fields is not None:
+            self.open()
+        if self.file is not None:
+            self.file.close()
+
+class JSONLinesSink(RecordSink):
+    """
+    One JSON object per line; nested fields are kept as they are.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(path, **kwargs)
+        self.file = None
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if self.file is None:
+            self.file = open(self.path, "w")
+        self.file.writelines(json.dumps(record, default=str) + "\n" for record in batch)
+        self.file.flush()
+
+    def close(self) -> None:
+        super().close()
+        if self.file is not None:
+            self.file.close()
+
+class ParquetSink(RecordSink):
+    """
+    Parquet with one row group per batch. The schema comes from the first
+    batch (or fields) and each later batch is cast to it; a column a later
+    batch needs wider (null -> any type, int -> float, mixed -> string) is
+    widened by rewriting the row groups written so far. Columns that only appear later
+    are dropped, as in CSVSink. Lists are stored as JSON strings.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(path, **kwargs)
+        self.writer = None
+        self.schema = None
+        self.dropped: set = set()
+
+    @staticmethod
+    def column(values: List[Any]) -> Any:
+        import pyarrow as pa
+
+        try:
+            return pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed types within the batch: keep the values as text
+            return pa.array([None if value is None else str(value) for value in values], pa.string())
+
+    @staticmethod
+    def widen(current: Any, incoming: Any) -> Any:
+        # The narrowest type holding both (int + float -> float), falling back to string
+        import pyarrow as pa
+
+        if incoming == current or pa.types.is_null(incoming):
+            return current
+        try:
+            return pa.unify_schemas([pa.schema([("c", current)]), pa.schema([("c", incoming)])], promote_options="permissive").field("c").type
+        except (pa.ArrowInvalid, pa.ArrowTypeError, NotImplementedError):
+            return pa.string()
+
+    def open(self, schema: Any) -> None:
+        import pyarrow.parquet as pq
+
+        previous = None
+        if self.writer is not None:
+            # Widening: reread what was written under the old schema and rewrite it under the new one
+            self.writer.close()
+            previous = pq.read_table(self.path).cast(schema)
+        self.schema = schema
+        self.writer = pq.ParquetWriter(self.path, schema, compression="zstd")
+        if previous is not None:
+            self.writer.write_table(previous, row_group_size=self.batch_size)
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        import pyarrow as pa
+
+        rows = [{key: json.dumps(value, default=str) if isinstance(value, (list, dict)) else value
+                 for key, value in flatten(record).items()} for record in batch]
+        if self.schema is not None:
+            names = self.schema.names
+        elif self.fields is not None:
+            names = self.fields
+        else:
+            names = list(dict.fromkeys(key for row in rows for key in row))
+        extra = {key for row in rows for key in row} - set(names) - self.dropped
+        if extra and self.schema is not None:
+            print(f"{self.path}: dropping columns not in the schema: {', '.join(sorted(extra))}")
+            self.dropped |= extra
+        columns = {name: self.column([row.get(name) for row in rows]) for name in names}
+        if self.schema is None:
+            self.open(pa.schema([(name, array.type) for name, array in columns.items()]))
+        else:
+            schema = pa.schema([(field.name, self.widen(field.type, columns[field.name].type)) for field in self.schema])
+            if not schema.equals(self.schema):
+                self.open(schema)
+        self.writer.write_table(pa.table({name: columns[name].cast(self.schema.field(name).type) for name in names}, schema=self.schema))
+
+    def close(self) -> None:
+        super().close()
+        if self.writer is not None:
+            self.writer.close()
+
+SINKS = {"csv": CSVSink, "parquet": ParquetSink, "jsonl": JSONLinesSink}
+
+def open_sink(stem: str, fmt: str = OUTPUT_FORMAT, **kwargs) -> RecordSink:
+    # Opens <stem>.<ext> for the configured format
+    return SINKS[fmt](output_path(stem, fmt), **kwargs)
@@ -0,0 +1,177 @@
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from campsite_filters import CampsiteView, index_campsite
+
+# Local RIDB campsite and facility store, kept current by delta syncs (see parse_rec_ridb.py).
+# Each endpoint has a watermark: the newest LastUpdatedDate stored from it. A sync only asks RIDB for
+# records updated since then, and filter profiles run as indexed SQL queries instead of a fresh crawl.
+
+# Set Globals
+STORE_PATH: str = os.environ.get('RIDB_STORE_PATH', '.cache/ridb_store.sqlite')     # SQLite database file
+SCHEMA_VERSION: int = 1                                                             # 1: every value of a repeated attribute is kept
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campsites (
+    campsite_id TEXT PRIMARY KEY,
+    facility_id TEXT,
+    campsite_type TEXT NOT NULL,
+    last_updated TEXT,
+    synced REAL NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS campsites_facility ON campsites (facility_id);
+CREATE INDEX IF NOT EXISTS campsites_type ON campsites (campsite_type);
+CREATE TABLE IF NOT EXISTS campsite_equipment (
+    campsite_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (campsite_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS campsite_equipment_name ON campsite_equipment (name);
+CREATE TABLE IF NOT EXISTS campsite_attributes (
+    campsite_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (campsite_id, name, value)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS campsite_attributes_value ON campsite_attributes (name, value);
+CREATE TABLE IF NOT EXISTS facilities (
+    facility_id TEXT PRIMARY KEY,
+    last_updated TEXT,
+    synced REAL NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    endpoint TEXT PRIMARY KEY,
+    watermark TEXT,
+    full_sync REAL,
+    synced REAL NOT NULL
+);
+"""
+
+
+def attribute_rows(campsite_id: str, view: CampsiteView) -> List[Tuple[str, str, str]]:
+    return [(campsite_id, name, value) for name, values in view.attributes.items() for value in sorted(values)]
+
+class RidbStore:
+    """
+    Campsites (with their equipment and attributes normalized into indexed
+    tables, as campsite_filters.index_campsite sees them), facilities and the
+    per-endpoint sync watermarks.
+    """
+
+    def __init__(self, path: str = STORE_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self.migrate()
+
+    def migrate(self) -> None:
+        # Stores from before SCHEMA_VERSION 1 kept one value per attribute name: rebuild the table from the stored records
+        self.conn.execute("DROP TABLE campsite_attributes")
+        self.conn.executescript(SCHEMA)
+        for campsite_id, record in self.conn.execute("SELECT campsite_id, record FROM campsites").fetchall():
+            self.conn.executemany("INSERT INTO campsite_attributes VALUES (?, ?, ?)", attribute_rows(campsite_id, index_campsite(json.loads(record))))
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "RidbStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def sync_state(self, endpoint: str) -> Dict[str, Any]:
+        row = self.conn.execute("SELECT watermark, full_sync, synced FROM sync_state WHERE endpoint = ?", (endpoint,)).fetchone()
+        if row is None:
+            return {"watermark": None, "full_sync": None, "synced": None}
+        return dict(zip(("watermark", "full_sync", "synced"), row))
+
+    def set_sync_state(self, endpoint: str, watermark: Optional[str], started: float, full: bool) -> None:
+        previous = self.sync_state(endpoint)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+            (endpoint, watermark, started if full else previous["full_sync"], started),
+        )
+        self.conn.commit()
+
+    def upsert_campsites(self, campsites: Iterable[Dict[str, Any]], synced: float) -> int:
+        count = 0
+        for campsite in campsites:
+            campsite_id = str(campsite.get("CampsiteID"))
+            view = index_campsite(campsite)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO campsites VALUES (?, ?, ?, ?, ?, ?)",
+                (campsite_id, str(campsite.get("FacilityID")), view.campsite_type, campsite.get("LastUpdatedDate"), synced, json.dumps(campsite)),
+            )
+            self.conn.execute("DELETE FROM campsite_equipment WHERE campsite_id = ?", (campsite_id,))
+            self.conn.execute("DELETE FROM campsite_attributes WHERE campsite_id = ?", (campsite_id,))
+            self.conn.executemany("INSERT INTO campsite_equipment VALUES (?, ?)", [(campsite_id, name) for name in view.equipment])
+            self.conn.executemany("INSERT INTO campsite_attributes VALUES (?, ?, ?)", attribute_rows(campsite_id, view))
+            count += 1
+        self.conn.commit()
+        return count
+
+    def upsert_facilities(self, facilities: Iterable[Dict[str, Any]], synced: float) -> int:
+        rows = [
+            (str(facility.get("FacilityID")), facility.get("LastUpdatedDate"), synced, json.dumps(facility))
+            for facility in facilities
+        ]
+        self.conn.executemany("INSERT OR REPLACE INTO facilities VALUES (?, ?, ?, ?)", rows)
+        self.conn.commit()
+        return len(rows)
+
+    def prune(self, table: str, before: float) -> int:
+        # After a full sync, drop whatever RIDB no longer lists
+        if table not in ("campsites", "facilities"):
+            raise ValueError(f"Unknown table: {table}")
+        if table == "campsites":
+            stale = "SELECT campsite_id FROM campsites WHERE synced < ?"
+            self.conn.execute(f"DELETE FROM campsite_equipment WHERE campsite_id IN ({stale})", (before,))
+            self.conn.execute(f"DELETE FROM campsite_attributes WHERE campsite_id IN ({stale})", (before,))
+        deleted = self.conn.execute(f"DELETE FROM {table} WHERE synced < ?", (before,)).rowcount
+        self.conn.commit()
+        return deleted
+
+    def count(self, table: str) -> int:
+        if table not in ("campsites", "facilities"):
+            raise ValueError(f"Unknown table: {table}")
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def facility(self, facility_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute("SELECT record FROM facilities WHERE facility_id = ?", (str(facility_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(self, where: str = "1", params: Iterable[Any] = ()) -> Iterator[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """
+        Yields (campsite, facility or None) for every stored campsite matching
+        a condition over campsites c (see campsite_filters.compile_profile_sql),
+        in numeric campsite ID order: the order RIDB lists them in, so callers
+        taking the first campsite per facility pick the one a full crawl meets
+        first. The IDs are stored as text, where "10" would sort before "9".
+        """
+        rows = self.conn.execute(
+            f"""SELECT c.record, f.record FROM campsites c LEFT JOIN facilities f ON f.facility_id = c.facility_id
+                WHERE {where} ORDER BY CAST(c.campsite_id AS INTEGER), c.campsite_id""",
+            list(params),
+        )
+        for campsite, facility in rows:
+            yield json.loads(campsite), json.loads(facility) if facility else None
+
+def full_sync_due(state: Dict[str, Any], interval: float) -> bool:
+    # Deltas never see deletions, so the whole catalogue is recrawled every interval seconds
+    return state["watermark"] is None or state["full_sync"] is None or time.time() - state["full_sync"] > interval
+
+def newest(records: List[Dict[str, Any]], watermark: Optional[str]) -> Optional[str]:
+    dates = [record["LastUpdatedDate"] for record in records if record.get("LastUpdatedDate")]
+    return max(dates + ([watermark] if watermark else []), default=None)
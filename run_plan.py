@@ -0,0 +1,190 @@
+import ast
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+# Incremental run planning for main.py: each step's inputs are fingerprinted, and a step whose
+# fingerprint is unchanged (and whose outputs are still on disk) is skipped and its last outputs reused.
+# Downstream steps run after their dependencies and rerun whenever an upstream output changes.
+
+# Set Globals
+STATE_FILE: Path = Path(os.environ.get('RUN_PLAN_STATE', '.cache/run_plan.json'))   # Fingerprints and outputs of the last successful runs
+ROOT: Path = Path(__file__).resolve().parent
+
+
+def nri_archive_url() -> str:
+    from parse_fema_nri import ZIP_URL
+    return ZIP_URL
+
+class Step(NamedTuple):
+    outputs: Tuple[str, ...] = ()               # Glob patterns of the files the step writes
+    env: Tuple[str, ...] = ()                   # Environment variables that change what it fetches or writes
+    files: Tuple[str, ...] = ()                 # Data files it reads (Python imports are found automatically)
+    remote: Optional[Callable[[], str]] = None  # URL whose ETag/Last-Modified marks a new upstream release
+    after: Tuple[str, ...] = ()                 # Steps whose outputs it consumes
+    max_age: Optional[float] = None             # Seconds before a run goes stale anyway (0: always run, None: never)
+
+# Steps known to the planner; a parse_*.py without an entry always runs
+COMMON_ENV: Tuple[str, ...] = ("OUTPUT_FORMAT",)
+STEPS: Dict[str, Step] = {
+    "parse_fema_nri": Step(outputs=("FEMA_NRI_*",), env=("NRI_HAZARDS", "NRI_TOP_K"), remote=nri_archive_url),
+    "parse_usda_nass": Step(outputs=("NASS_USDA_*",), env=COMMON_ENV + ("NASS_BATCH_MODE",), max_age=30 * 24 * 3600),   # Census values, as CACHE_TTL
+    "parse_rec_ridb": Step(outputs=("REC_RIDB_*",), env=COMMON_ENV + ("RIDB_FACILITY_MODE", "RIDB_FILTER_PROFILE", "RIDB_FILTERS_FILE", "RIDB_SYNC_MODE"),
+                           files=("ridb_filters.json",), max_age=24 * 3600),                                               # As CACHE_TTL
+    "parse_nws_alerts": Step(outputs=("NWS_ALERTS_*", "NWS_ALERT_AREAS_*"), env=COMMON_ENV, max_age=0),                 # Live alerts
+    "join_counties": Step(outputs=("COUNTY_JOIN_*",), after=("parse_fema_nri", "parse_usda_nass", "parse_nws_alerts")),
+    "match_alerts": Step(outputs=("ALERT_CAMPSITES_*",), after=("parse_nws_alerts", "parse_rec_ridb")),
+}
+
+
+def step_for(name: str) -> Step:
+    return STEPS.get(name, Step(max_age=0))
+
+def plan(names: List[str]) -> List[str]:
+    """
+    Returns the requested steps plus every downstream step that consumes one
+    of them, ordered so each step comes after its dependencies.
+    """
+    selected: Set[str] = set(names)
+    changed = True
+    while changed:
+        downstream = {name for name, step in STEPS.items() if set(step.after) & selected and (ROOT / f"{name}.py").exists()}
+        changed = not downstream <= selected
+        selected |= downstream
+    ordered: List[str] = []
+    def visit(name: str) -> None:
+        if name in ordered:
+            return
+        for dependency in step_for(name).after:
+            if dependency in selected:
+                visit(dependency)
+        ordered.append(name)
+    for name in sorted(selected):
+        visit(name)
+    return ordered
+
+def local_modules(script: Path, seen: Optional[Set[Path]] = None) -> Set[Path]:
+    # The script and every repository module it imports, directly or not (including imports inside functions)
+    seen = seen if seen is not None else set()
+    if script in seen or not script.exists():
+        return seen
+    seen.add(script)
+    for node in ast.walk(ast.parse(script.read_text())):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            local_modules(ROOT / f"{module.split('.')[0]}.py", seen)
+    return seen
+
+def file_digest(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+def remote_version(url: str) -> Optional[str]:
+    # ETag (or Last-Modified) of the upstream release; None when it cannot be checked
+    from http_client import build_retry, create_session
+    # A planning probe, not a source: kept out of the network metrics and their reports
+    session = create_session("RUN_PLAN", retries=build_retry(total=2, backoff_factor=0.5), metrics=False)
+    try:
+        response = session.head(url, allow_redirects=True)
+        response.raise_for_status()
+    except Exception as e:
+        print(f"Could not check {url}: {e}")
+        return None
+    return response.headers.get("ETag") or response.headers.get("Last-Modified")
+
+def remote_versions(names: List[str]) -> Dict[str, Optional[str]]:
+    # Upstream release versions of the steps with a remote input, all checked at once before any step is scheduled
+    urls = {name: step_for(name).remote() for name in names if step_for(name).remote is not None}
+    if not urls:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        return dict(zip(urls, pool.map(remote_version, urls.values())))
+
+def output_signature(outputs: List[str]) -> List[Tuple[str, int, int]]:
+    signature = []
+    for output in outputs:
+        stat = os.stat(output)
+        signature.append((output, stat.st_size, stat.st_mtime_ns))
+    return signature
+
+class RunState:
+    """
+    Fingerprint, finish time and outputs of each step's last successful run.
+    """
+
+    def __init__(self, path: Path = STATE_FILE):
+        self.path = path
+        try:
+            self.steps: Dict[str, Dict[str, Any]] = json.loads(path.read_text())
+        except (OSError, ValueError):
+            self.steps = {}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.with_suffix(".tmp").write_text(json.dumps(self.steps, indent=2))
+        os.replace(self.path.with_suffix(".tmp"), self.path)
+
+    def outputs(self, name: str) -> List[str]:
+        return self.steps.get(name, {}).get("outputs", [])
+
+    def fingerprint(self, name: str, script: Path, remote: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """
+        Returns {"local": digest of the step's code, data files, environment and
+        upstream outputs, "remote": upstream release version}. remote is the
+        version found by remote_versions(); it is None when the step has no
+        remote input or it could not be checked.
+        """
+        step = step_for(name)
+        parts: Dict[str, Any] = {
+            "code": {str(path.relative_to(ROOT)): file_digest(path) for path in sorted(local_modules(script.resolve()))},
+            "files": {file: file_digest(ROOT / file) for file in step.files if (ROOT / file).exists()},
+            "env": {var: os.environ.get(var) for var in step.env},
+            "after": {dependency: self.signature(dependency) for dependency in step.after},
+        }
+        return {
+            "local": hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest(),
+            "remote": remote if step.remote is not None else None,
+        }
+
+    def signature(self, name: str) -> List[Tuple[str, int, int]]:
+        return output_signature([output for output in self.outputs(name) if os.path.exists(output)])
+
+    def reusable(self, name: str, fingerprint: Dict[str, Optional[str]]) -> Optional[str]:
+        # Why the last run can be reused, or None if the step has to run
+        last = self.steps.get(name)
+        step = step_for(name)
+        if last is None or step.max_age == 0:
+            return None
+        outputs = self.outputs(name)
+        if step.outputs and (not outputs or not all(os.path.exists(output) for output in outputs)):
+            return None
+        if step.max_age is not None and time.time() - last["finished"] > step.max_age:
+            return None
+        if last["fingerprint"]["local"] != fingerprint["local"]:
+            return None
+        if step.remote is None:
+            return "inputs unchanged"
+        if fingerprint["remote"] is None:
+            # Offline: a run could not fetch a new release anyway, so keep the last outputs
+            return "inputs unchanged, upstream unreachable"
+        return "inputs and upstream release unchanged" if last["fingerprint"]["remote"] == fingerprint["remote"] else None
+
+    def record(self, name: str, fingerprint: Dict[str, Optional[str]], started: float) -> List[str]:
+        # Outputs are the files matching the step's patterns written since it started
+        outputs = sorted(
+            path for pattern in step_for(name).outputs for path in glob.glob(pattern)
+            if os.path.getmtime(path) >= started
+        )
+        self.steps[name] = {"fingerprint": fingerprint, "finished": time.time(), "outputs": outputs}
+        self.save()
+        return outputs
@@ -0,0 +1,169 @@
+import importlib
+import importlib.util
+import io
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from importlib.metadata import entry_points
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, TextIO
+
+# Source plugins: every source and stage exposes main(argv) -> exit code and does no work at import time,
+# so main.py can run them all in one warm interpreter (shared imports, HTTP cache and rate limiters).
+# Plugins are registered below; installed packages can add their own under the ENTRY_POINT_GROUP entry point group.
+
+# Set Globals
+ENTRY_POINT_GROUP: str = 'storm_chaser.sources'
+ROOT: Path = Path(__file__).resolve().parent
+
+EntryPoint = Callable[[Optional[List[str]]], Optional[int]]
+
+
+class Plugin(NamedTuple):
+    name: str
+    entry: str                  # "module:function", imported only when the plugin runs
+    source: bool = True         # Fetches from upstream (False: a stage that only consumes other outputs)
+
+    @property
+    def module(self) -> str:
+        return self.entry.partition(":")[0]
+
+    def load(self) -> EntryPoint:
+        module, _, function = self.entry.partition(":")
+        return getattr(importlib.import_module(module), function or "main")
+
+    @property
+    def script(self) -> Path:
+        # The module's file, for running it in its own interpreter; found without importing it
+        local = ROOT / f"{self.module}.py"
+        if local.exists():
+            return local
+        spec = importlib.util.find_spec(self.module)
+        if spec is None or spec.origin is None:
+            raise ModuleNotFoundError(f"No module named {self.module!r} for plugin {self.name}")
+        return Path(spec.origin)
+
+PLUGINS: Dict[str, Plugin] = {}
+
+
+def register(name: str, entry: str, source: bool = True) -> Plugin:
+    PLUGINS[name] = Plugin(name, entry, source)
+    return PLUGINS[name]
+
+register("parse_fema_nri", "parse_fema_nri:main")
+register("parse_nws_alerts", "parse_nws_alerts:main")
+register("parse_rec_ridb", "parse_rec_ridb:main")
+register("parse_usda_nass", "parse_usda_nass:main")
+register("join_counties", "join_counties:main", source=False)
+register("match_alerts", "match_alerts:main", source=False)
+
+def load_installed() -> None:
+    # Plugins from installed packages; a broken distribution must not stop the built-in sources
+    try:
+        installed = entry_points(group=ENTRY_POINT_GROUP)
+    except Exception as e:
+        print(f"Could not read {ENTRY_POINT_GROUP} entry points: {e}", file=sys.stderr)
+        return
+    for entry_point in installed:
+        register(entry_point.name, entry_point.value)
+
+load_installed()
+
+def sources() -> List[str]:
+    return sorted(name for name, plugin in PLUGINS.items() if plugin.source)
+
+def plugins() -> List[str]:
+    # Every registered step, downstream stages included
+    return sorted(PLUGINS)
+
+def get_plugin(name: str) -> Plugin:
+    # A name without a registration is looked up as a local module with a main()
+    return PLUGINS.get(name) or Plugin(name, f"{name}:main")
+
+def script_for(name: str) -> Path:
+    return get_plugin(name).script
+
+class ThreadOutput(io.TextIOBase):
+    """
+    sys.stdout/sys.stderr replacement that sends each thread's writes to the
+    stream it captured with, and every other thread's to the original stream.
+    """
+
+    def __init__(self, default: TextIO):
+        self.default = default
+        self.local = threading.local()
+
+    def target(self) -> TextIO:
+        return getattr(self.local, "stream", None) or self.default
+
+    def write(self, text: str) -> int:
+        return self.target().write(text)
+
+    def flush(self) -> None:
+        self.target().flush()
+
+    def writable(self) -> bool:
+        return True
+
+    @property
+    def encoding(self) -> str:
+        return getattr(self.default, "encoding", "utf-8")
+
+output_lock = threading.Lock()
+
+@contextmanager
+def capture_output(stream: TextIO) -> Iterator[None]:
+    # Route this thread's print() and tracebacks to stream; threads the plugin starts itself still write to the console
+    with output_lock:
+        if not isinstance(sys.stdout, ThreadOutput):
+            sys.stdout = ThreadOutput(sys.stdout)
+        if not isinstance(sys.stderr, ThreadOutput):
+            sys.stderr = ThreadOutput(sys.stderr)
+    sys.stdout.local.stream = sys.stderr.local.stream = stream
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stdout.local.stream = sys.stderr.local.stream = None
+
+def exit_code(code: Any) -> int:
+    # Same mapping as the interpreter applies to sys.exit() arguments
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+def report_metrics(plugin: Plugin) -> None:
+    # Each plugin reports its own source as it finishes, instead of every source at interpreter exit
+    module = sys.modules.get(plugin.module)
+    source = getattr(module, "DATA_SOURCE", None)
+    if source is None:
+        return
+    from http_metrics import report
+    try:
+        report(source)
+    except Exception:
+        traceback.print_exc()
+
+def run_plugin(name: str, log: TextIO, argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Runs a plugin's entry point in this thread with its output captured to log,
+    followed by the network report of its DATA_SOURCE (see http_metrics.py).
+    Returns {"ReturnCode", "Wall", "CPU"}; CPU only counts this thread.
+    """
+    plugin = get_plugin(name)
+    start, cpu = time.perf_counter(), time.thread_time()
+    with capture_output(log):
+        try:
+            code = exit_code(plugin.load()(argv or []))
+        except SystemExit as e:
+            code = exit_code(e.code)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        report_metrics(plugin)
+    return {"ReturnCode": code, "Wall": time.perf_counter() - start, "CPU": time.thread_time() - cpu}
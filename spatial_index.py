@@ -0,0 +1,94 @@
+import math
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+# Uniform grid index over (longitude, latitude) points, queried with GeoJSON Polygon/MultiPolygon geometries.
+# A query only tests the points in grid cells under the polygon's bounding box, and tests them
+# against every polygon edge at once with numpy, so re-running after each alert refresh stays cheap.
+
+# Set Globals
+CELL_SIZE: float = 0.25                     # Grid cell size in degrees (~25 km), about the size of a warning polygon
+
+Ring = np.ndarray                           # (n, 2) array of lon/lat vertices
+
+
+def polygons(geometry: Dict[str, Any]) -> Iterator[List[Ring]]:
+    # Each polygon as [outer ring, *holes], from a GeoJSON Polygon or MultiPolygon
+    kind = geometry.get("type")
+    if kind == "Polygon":
+        yield [np.asarray(ring, dtype="float64")[:, :2] for ring in geometry["coordinates"]]
+    elif kind == "MultiPolygon":
+        for polygon in geometry["coordinates"]:
+            yield [np.asarray(ring, dtype="float64")[:, :2] for ring in polygon]
+
+def in_ring(x: np.ndarray, y: np.ndarray, ring: Ring) -> np.ndarray:
+    # Even-odd ray casting of many points against one ring, one vectorized pass per edge
+    inside = np.zeros(len(x), dtype=bool)
+    x1, y1 = ring[:, 0], ring[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    for ax, ay, bx, by in zip(x1, y1, x2, y2):
+        if ay == by:
+            continue
+        crosses = (ay > y) != (by > y)
+        inside ^= crosses & (x < ax + (y - ay) * (bx - ax) / (by - ay))
+    return inside
+
+def in_polygon(x: np.ndarray, y: np.ndarray, rings: List[Ring]) -> np.ndarray:
+    inside = in_ring(x, y, rings[0])
+    for hole in rings[1:]:
+        if inside.any():
+            inside &= ~in_ring(x, y, hole)
+    return inside
+
+class PointGrid:
+    """
+    Points bucketed into CELL_SIZE-degree cells. query() returns the indices
+    (into the arrays it was built from) of every point inside a geometry.
+    """
+
+    def __init__(self, lon: Sequence[float], lat: Sequence[float], cell_size: float = CELL_SIZE):
+        self.lon = np.asarray(lon, dtype="float64")
+        self.lat = np.asarray(lat, dtype="float64")
+        self.cell_size = cell_size
+        valid = np.flatnonzero(np.isfinite(self.lon) & np.isfinite(self.lat))
+        cx = np.floor(self.lon[valid] / cell_size).astype("int64")
+        cy = np.floor(self.lat[valid] / cell_size).astype("int64")
+        # Sort once by cell and keep (start, stop) slices instead of a list per cell
+        order = np.lexsort((cy, cx))
+        self.points = valid[order]
+        cells = np.stack([cx[order], cy[order]], axis=1)
+        starts = np.flatnonzero(np.r_[True, (cells[1:] != cells[:-1]).any(axis=1)]) if len(cells) else np.array([], dtype="int64")
+        stops = np.r_[starts[1:], len(cells)]
+        self.cells: Dict[Tuple[int, int], Tuple[int, int]] = {
+            (int(cells[start, 0]), int(cells[start, 1])): (int(start), int(stop)) for start, stop in zip(starts, stops)
+        }
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def candidates(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> np.ndarray:
+        x0, x1 = math.floor(min_lon / self.cell_size), math.floor(max_lon / self.cell_size)
+        y0, y1 = math.floor(min_lat / self.cell_size), math.floor(max_lat / self.cell_size)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            # Polygon covers more cells than are occupied: scan the occupied ones
+            slices = [span for (cx, cy), span in self.cells.items() if x0 <= cx <= x1 and y0 <= cy <= y1]
+        else:
+            slices = [self.cells[cell] for cell in ((cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)) if cell in self.cells]
+        if not slices:
+            return np.array([], dtype="int64")
+        return np.concatenate([self.points[start:stop] for start, stop in slices])
+
+    def query(self, geometry: Dict[str, Any]) -> np.ndarray:
+        matches: List[np.ndarray] = []
+        for rings in polygons(geometry):
+            outer = rings[0]
+            min_lon, min_lat = outer.min(axis=0)
+            max_lon, max_lat = outer.max(axis=0)
+            candidates = self.candidates(min_lon, min_lat, max_lon, max_lat)
+            x, y = self.lon[candidates], self.lat[candidates]
+            in_box = (x >= min_lon) & (x <= max_lon) & (y >= min_lat) & (y <= max_lat)
+            candidates, x, y = candidates[in_box], x[in_box], y[in_box]
+            if len(candidates):
+                matches.append(candidates[in_polygon(x, y, rings)])
+        return np.unique(np.concatenate(matches)) if matches else np.array([], dtype="int64")
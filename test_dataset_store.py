@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import pyarrow as pa
+
+from dataset_store import DatasetStore
+
+
+def archive(store: DatasetStore, directory: Path, name: str, content: str) -> None:
+    output = directory / name
+    output.write_text(content)
+    store.ingest(output)
+
+def test_scan_widens_a_column_whose_type_drifted(tmp_path: Path) -> None:
+    # CSV inference makes Code int64 in the first run and string in the second
+    store = DatasetStore(tmp_path / "datasets")
+    archive(store, tmp_path, "DRIFT_20261001T000000.csv", "Code,Name\n1,a\n2,b\n")
+    archive(store, tmp_path, "DRIFT_20261002T000000.csv", "Code,Name,Added\nA7,c,1\n")
+
+    table = store.scan("DRIFT")
+
+    assert table.schema.field("Code").type == pa.string()
+    assert table.column("Code").to_pylist() == ["1", "2", "A7"]
+    assert table.column("Added").to_pylist() == [None, None, 1]
+
+def test_scan_ignores_drift_in_columns_not_requested(tmp_path: Path) -> None:
+    store = DatasetStore(tmp_path / "datasets")
+    archive(store, tmp_path, "DRIFT_20261001T000000.csv", "Code,Name\n1,a\n")
+    archive(store, tmp_path, "DRIFT_20261002T000000.csv", "Code,Name\nA7,b\n")
+
+    table = store.scan("DRIFT", columns=["Name"])
+
+    assert table.column_names == ["Name"]
+    assert table.column("Name").to_pylist() == ["a", "b"]
+
+def test_scan_promotes_int_to_float(tmp_path: Path) -> None:
+    store = DatasetStore(tmp_path / "datasets")
+    archive(store, tmp_path, "DRIFT_20261001T000000.csv", "Value\n1\n")
+    archive(store, tmp_path, "DRIFT_20261002T000000.csv", "Value\n2.5\n")
+
+    table = store.scan("DRIFT", columns=["Value"])
+
+    assert table.schema.field("Value").type == pa.float64()
+    assert table.column("Value").to_pylist() == [1.0, 2.5]